@@ -0,0 +1,74 @@
+from collections import defaultdict
+
+
+def to_cents(amount):
+    """Convert an amount in euros to integer cents."""
+    return int(round(amount * 100))
+
+
+def month_of(expense):
+    """Return the (year, month) an expense belongs to."""
+    return (expense.date.year, expense.date.month)
+
+
+class ExpenseAggregates:
+    """Running expense totals by category, by month and by month and category.
+
+    Categories are keyed by their CategoryRegistry id, so renaming a category
+    leaves the totals untouched. Totals are kept in integer cents so repeated
+    adds and removes don't drift.
+    Every update is O(1); callers must remove an expense before changing its
+    amount, date or category and add it again afterwards.
+    """
+    def __init__(self, expenses=()):
+        self.total = 0
+        self.category_totals = defaultdict(int)
+        self.month_totals = defaultdict(int)
+        self.month_category_totals = defaultdict(lambda: defaultdict(int))
+        for expense in expenses:
+            self.add(expense)
+
+    def _apply(self, category_id, month, cents):
+        self.total += cents
+        self.category_totals[category_id] += cents
+        self.month_totals[month] += cents
+        self.month_category_totals[month][category_id] += cents
+        # Drop emptied entries so summaries only list what is left
+        if not self.category_totals[category_id]:
+            del self.category_totals[category_id]
+        if not self.month_totals[month]:
+            del self.month_totals[month]
+        if not self.month_category_totals[month][category_id]:
+            del self.month_category_totals[month][category_id]
+            if not self.month_category_totals[month]:
+                del self.month_category_totals[month]
+
+    def add(self, expense):
+        """Add an expense to the totals."""
+        self._apply(expense.category_id, month_of(expense), to_cents(expense.amount))
+
+    def remove(self, expense):
+        """Remove an expense from the totals."""
+        self._apply(expense.category_id, month_of(expense), -to_cents(expense.amount))
+
+    def move_category(self, old_id, new_id):
+        """Add the totals of category old_id to new_id, as when its expenses are refiled."""
+        if old_id == new_id:
+            return
+        cents = self.category_totals.pop(old_id, 0)
+        if cents:
+            self.category_totals[new_id] += cents
+        for categories in self.month_category_totals.values():
+            cents = categories.pop(old_id, 0)
+            if cents:
+                categories[new_id] += cents
+
+    def total_for(self, month=None):
+        """Return the total in euros for a (year, month), or overall if month is None."""
+        cents = self.total if month is None else self.month_totals.get(month, 0)
+        return cents / 100
+
+    def categories_for(self, month=None):
+        """Return {category id: total in euros} for a (year, month), or overall if month is None."""
+        totals = self.category_totals if month is None else self.month_category_totals.get(month, {})
+        return {category_id: cents / 100 for category_id, cents in totals.items()}
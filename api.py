@@ -0,0 +1,451 @@
+"""JSON over HTTP API for the expense tracker, serving many clients from one process.
+
+All requests share one ExpenseTracker, and with it one ledger, one local
+store and one Google Sheets client. The asyncio event loop only parses and
+writes HTTP; tracker calls run on a small thread pool, so a slow Sheets read
+never holds up other clients. Changes are made under the tracker's lock and
+saved to Google Sheets by its write-behind worker, exactly as menu actions are.
+
+Every expense carries a version derived from its contents. Edits and deletes
+must send the version they were based on (in the body or an If-Match header);
+if the expense changed since, through the API, the menu or the sheet, the
+request fails with 409 and the current expense.
+
+Endpoints:
+    GET    /expenses              ?start=&end=&category=&name=&min_amount=&max_amount=&offset=&limit=
+    POST   /expenses              {"name", "amount", "category", "date"}
+    GET    /expenses/<id>
+    PATCH  /expenses/<id>         {"version", "name"?, "amount"?, "category"?}
+    DELETE /expenses/<id>         {"version"}
+    GET    /categories
+    POST   /categories            {"name"}
+    PUT    /categories/<name>     {"name"}
+    DELETE /categories/<name>     ?move_to=  (required while expenses are filed under it)
+    GET    /budget
+    PUT    /budget                {"budget"}
+    GET    /summary               ?month=MM-YYYY
+
+Usage: python api.py [--host 127.0.0.1] [--port 8000]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+from local_store import LocalStore
+from run import PAGE_SIZE, Expense, ExpenseTracker, get_spreadsheet, parse_date, setup_logging
+
+WORKERS = 8  # Threads running tracker calls
+MAX_BODY = 1024 * 1024  # Bytes accepted in a request body
+MAX_PAGE_SIZE = 1000  # Most expenses returned by one list request
+IDLE_TIMEOUT = 30  # Seconds an idle keep-alive connection is kept open
+
+
+class APIError(Exception):
+    """An error answered with an HTTP status and a JSON body."""
+    def __init__(self, status, message, **details):
+        super().__init__(message)
+        self.status = status
+        self.body = {"error": message, **details}
+
+
+def expense_version(expense):
+    """Return the version of an expense: a short hash of its contents."""
+    return hashlib.blake2b(expense.fingerprint().encode(), digest_size=8).hexdigest()
+
+
+def expense_json(expense, archived=False):
+    return {
+        "id": expense.id,
+        "name": expense.name,
+        "amount": expense.amount,
+        "category": expense.category,
+        "date": expense.date_str(),
+        "version": expense_version(expense),
+        "archived": archived,
+    }
+
+
+def _date_param(query, key):
+    value = query.get(key)
+    if value is None:
+        return None
+    try:
+        return parse_date(value).date()
+    except ValueError:
+        raise APIError(HTTPStatus.BAD_REQUEST, f"{key} must be a DD-MM-YYYY date")
+
+
+def _number_param(value, key, minimum=None):
+    number = None
+    if isinstance(value, (str, int, float)) and not isinstance(value, bool):
+        try:
+            number = float(value)
+        except (ValueError, OverflowError):
+            pass
+    # JSON NaN and Infinity, and "nan" or "inf" in a query, are not amounts
+    if number is None or not math.isfinite(number) or (minimum is not None and number < minimum):
+        condition = f" of at least {minimum}" if minimum is not None else ""
+        raise APIError(HTTPStatus.BAD_REQUEST, f"{key} must be a number{condition}")
+    return number
+
+
+def _text_param(body, key):
+    value = body.get(key)
+    if not isinstance(value, str) or not value.strip():
+        raise APIError(HTTPStatus.BAD_REQUEST, f"{key} must be a non-empty string")
+    return value.strip()
+
+
+class ExpenseAPI:
+    """Request handlers over a shared ExpenseTracker.
+
+    The tracker needs a local store: its row ids are the expense ids of the
+    API and stay the same across restarts.
+    """
+    def __init__(self, tracker, workers=WORKERS):
+        if tracker.store is None:
+            raise ValueError("The API needs a tracker with a local store")
+        self.tracker = tracker
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+        self.by_id = {}  # Expense id -> Expense, rebuilt when an id is not found
+        self.routes = [
+            ("GET", re.compile(r"/expenses"), self.list_expenses),
+            ("POST", re.compile(r"/expenses"), self.add_expense),
+            ("GET", re.compile(r"/expenses/(\d+)"), self.get_expense),
+            ("PATCH", re.compile(r"/expenses/(\d+)"), self.update_expense),
+            ("DELETE", re.compile(r"/expenses/(\d+)"), self.delete_expense),
+            ("GET", re.compile(r"/categories"), self.list_categories),
+            ("POST", re.compile(r"/categories"), self.add_category),
+            ("PUT", re.compile(r"/categories/([^/]+)"), self.rename_category),
+            ("DELETE", re.compile(r"/categories/([^/]+)"), self.delete_category),
+            ("GET", re.compile(r"/budget"), self.get_budget),
+            ("PUT", re.compile(r"/budget"), self.set_budget),
+            ("GET", re.compile(r"/summary"), self.summary),
+        ]
+
+    # Handlers run on the thread pool. Each returns (status, JSON body).
+
+    def find_expense(self, expense_id):
+        """Return the ledger expense with the given id. Called with the lock held."""
+        tracker = self.tracker
+        expense = self.by_id.get(expense_id)
+        if expense is None or expense.id != expense_id or id(expense) not in tracker.expense_index.expenses:
+            self.by_id = {expense.id: expense for expense in tracker.expenses if expense.id is not None}
+            expense = self.by_id.get(expense_id)
+        if expense is None:
+            raise APIError(HTTPStatus.NOT_FOUND, f"No expense {expense_id}")
+        return expense
+
+    def check_version(self, expense, body, headers):
+        version = body.get("version") or headers.get("if-match", "").strip('"') or None
+        if version is None:
+            raise APIError(HTTPStatus.PRECONDITION_REQUIRED, "Send the version of the expense being changed")
+        if version != expense_version(expense):
+            raise APIError(HTTPStatus.CONFLICT, "The expense was changed by someone else",
+                           expense=expense_json(expense))
+
+    def list_expenses(self, query, body, headers):
+        tracker = self.tracker
+        filters = {
+            "start": _date_param(query, "start"),
+            "end": _date_param(query, "end"),
+            "category": query.get("category"),
+            "name": query.get("name"),
+            "min_amount": _number_param(query["min_amount"], "min_amount") if "min_amount" in query else None,
+            "max_amount": _number_param(query["max_amount"], "max_amount") if "max_amount" in query else None,
+        }
+        offset = int(_number_param(query.get("offset", "0"), "offset", minimum=0))
+        limit = int(_number_param(query.get("limit", str(PAGE_SIZE)), "limit", minimum=1))
+        limit = min(limit, MAX_PAGE_SIZE)
+        if any(value is not None for value in filters.values()):
+            # Read outside the lock; filter_expenses then finds them loaded
+            tracker.load_archived_months(tracker.archived_months_between(filters["start"], filters["end"]))
+        with tracker.lock:
+            matches = tracker.filter_expenses(**filters)
+            live = tracker.expense_index.expenses
+            page = [expense_json(expense, archived=id(expense) not in live)
+                    for expense in matches[offset:offset + limit]]
+            return HTTPStatus.OK, {"expenses": page, "total": len(matches), "offset": offset}
+
+    def add_expense(self, query, body, headers):
+        tracker = self.tracker
+        name = _text_param(body, "name")
+        amount = _number_param(body.get("amount"), "amount", minimum=0)
+        category = _text_param(body, "category")
+        try:
+            expense = Expense(name, amount, category, str(body.get("date", "")))
+        except ValueError as e:
+            raise APIError(HTTPStatus.BAD_REQUEST, str(e))
+        with tracker.lock:
+            if category not in tracker.expense_categories:
+                raise APIError(HTTPStatus.BAD_REQUEST, f"Unknown category: {category}")
+            try:
+                tracker.add_expense(expense)
+            except ValueError as e:
+                raise APIError(HTTPStatus.BAD_REQUEST, str(e))
+            tracker.commit_changes("add")
+            return HTTPStatus.CREATED, expense_json(expense)
+
+    def get_expense(self, query, body, headers, expense_id):
+        with self.tracker.lock:
+            return HTTPStatus.OK, expense_json(self.find_expense(int(expense_id)))
+
+    def update_expense(self, query, body, headers, expense_id):
+        tracker = self.tracker
+        changes = {}
+        if "name" in body:
+            changes["name"] = _text_param(body, "name")
+        if "amount" in body:
+            changes["amount"] = _number_param(body["amount"], "amount", minimum=0)
+        if "category" in body:
+            changes["category"] = _text_param(body, "category")
+        with tracker.lock:
+            expense = self.find_expense(int(expense_id))
+            self.check_version(expense, body, headers)
+            if "category" in changes and changes["category"] not in tracker.expense_categories:
+                raise APIError(HTTPStatus.BAD_REQUEST, f"Unknown category: {changes['category']}")
+            tracker.update_expense(expense, **changes)
+            tracker.commit_changes("edit")
+            return HTTPStatus.OK, expense_json(expense)
+
+    def delete_expense(self, query, body, headers, expense_id):
+        tracker = self.tracker
+        with tracker.lock:
+            expense = self.find_expense(int(expense_id))
+            self.check_version(expense, body, headers)
+            tracker.remove_expense(tracker.expenses.index(expense))
+            tracker.commit_changes("remove")
+            return HTTPStatus.NO_CONTENT, None
+
+    def list_categories(self, query, body, headers):
+        with self.tracker.lock:
+            return HTTPStatus.OK, {"categories": list(self.tracker.expense_categories)}
+
+    def add_category(self, query, body, headers):
+        tracker = self.tracker
+        name = _text_param(body, "name")
+        with tracker.lock:
+            if name in tracker.expense_categories:
+                raise APIError(HTTPStatus.CONFLICT, f"Category already exists: {name}")
+            tracker.expense_categories.append(name)
+            tracker.commit_changes("add_category")
+            return HTTPStatus.CREATED, {"categories": list(tracker.expense_categories)}
+
+    def rename_category(self, query, body, headers, name):
+        tracker = self.tracker
+        name = unquote(name)
+        new_name = _text_param(body, "name")
+        # The archived rows being renamed are read outside the lock
+        tracker.load_category_months(name)
+        tracker.load_category_months(new_name)
+        with tracker.lock:
+            if name not in tracker.expense_categories:
+                raise APIError(HTTPStatus.NOT_FOUND, f"No category {name}")
+            if new_name != name and new_name in tracker.expense_categories:
+                raise APIError(HTTPStatus.CONFLICT, f"Category already exists: {new_name}")
+            try:
+                tracker.rename_category(tracker.expense_categories.index(name), new_name)
+            except RuntimeError as e:
+                raise APIError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+            tracker.commit_changes("rename_category")
+            return HTTPStatus.OK, {"categories": list(tracker.expense_categories)}
+
+    def delete_category(self, query, body, headers, name):
+        tracker = self.tracker
+        name = unquote(name)
+        replacement = query.get("move_to")
+        tracker.load_category_months(name)
+        with tracker.lock:
+            if name not in tracker.expense_categories:
+                raise APIError(HTTPStatus.NOT_FOUND, f"No category {name}")
+            if replacement is not None and (replacement == name or replacement not in tracker.expense_categories):
+                raise APIError(HTTPStatus.BAD_REQUEST, f"move_to must be another category, not {replacement}")
+            if replacement is None and tracker.category_in_use(name):
+                raise APIError(HTTPStatus.CONFLICT, f"Category {name} still has expenses; give move_to")
+            try:
+                tracker.delete_category(tracker.expense_categories.index(name), replacement)
+            except RuntimeError as e:
+                raise APIError(HTTPStatus.SERVICE_UNAVAILABLE, str(e))
+            tracker.commit_changes("delete_category")
+            return HTTPStatus.OK, {"categories": list(tracker.expense_categories)}
+
+    def get_budget(self, query, body, headers):
+        return HTTPStatus.OK, {"budget": self.tracker.user_budget}
+
+    def set_budget(self, query, body, headers):
+        budget = _number_param(body.get("budget"), "budget", minimum=0)
+        with self.tracker.lock:
+            self.tracker.set_user_budget(budget)
+        return HTTPStatus.OK, {"budget": budget}
+
+    def summary(self, query, body, headers):
+        tracker = self.tracker
+        if "month" in query:
+            try:
+                month_date = datetime.strptime(query["month"], "%m-%Y")
+            except ValueError:
+                raise APIError(HTTPStatus.BAD_REQUEST, "month must be MM-YYYY")
+        else:
+            month_date = datetime.now()
+        month = (month_date.year, month_date.month)
+        with tracker.lock:
+            total = tracker.month_total(month)
+            return HTTPStatus.OK, {
+                "month": month_date.strftime("%m-%Y"),
+                "total": round(total, 2),
+                "budget": tracker.user_budget,
+                "remaining": round(tracker.remaining_budget(month), 2),
+                "categories": {category: round(amount, 2)
+                               for category, amount in tracker.month_categories(month).items()},
+            }
+
+    # HTTP
+
+    def route(self, method, path):
+        """Return (handler, path arguments, operation name) for a request."""
+        allowed = False
+        for route_method, pattern, handler in self.routes:
+            match = pattern.fullmatch(path)
+            if match:
+                if route_method == method:
+                    return handler, match.groups(), handler.__name__
+                allowed = True
+        if allowed:
+            raise APIError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed on {path}")
+        raise APIError(HTTPStatus.NOT_FOUND, f"No such resource: {path}")
+
+    def call(self, handler, operation, query, body, headers, arguments):
+        """Run a handler on the thread pool, timing it in the metrics registry."""
+        with metrics.timed("api_request", operation):
+            return handler(query, body, headers, *arguments)
+
+    async def respond(self, method, target, headers, raw_body):
+        """Answer one request; returns (status, JSON body or None)."""
+        try:
+            url = urlsplit(target)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            handler, arguments, operation = self.route(method, url.path.rstrip("/") or "/")
+            try:
+                body = json.loads(raw_body) if raw_body else {}
+            except ValueError:
+                raise APIError(HTTPStatus.BAD_REQUEST, "The body must be JSON")
+            if not isinstance(body, dict):
+                raise APIError(HTTPStatus.BAD_REQUEST, "The body must be a JSON object")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, partial(self.call, handler, operation, query, body, headers, arguments)
+            )
+        except APIError as e:
+            return e.status, e.body
+        except Exception as e:
+            self.tracker.logger.error(f"Error handling {method} {target}: {e}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}
+
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one (keep-alive) connection."""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, {"error": "Malformed request line"}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # The rest of the stream can't be framed; answer and close
+                    await self.send(writer, HTTPStatus.BAD_REQUEST, {"error": "Invalid Content-Length"}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {"error": "Body too large"}, False)
+                    break
+                raw_body = await reader.readexactly(length) if length else b""
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                status, body = await self.respond(method.upper(), target, headers, raw_body)
+                await self.send(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def send(self, writer, status, body, keep_alive):
+        status = HTTPStatus(status)
+        payload = b"" if body is None else json.dumps(body).encode()
+        head = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(payload)}",
+                f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+        if payload:
+            head.append("Content-Type: application/json")
+        if isinstance(body, dict) and "version" in body:
+            head.append(f'ETag: "{body["version"]}"')
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + payload)
+        await writer.drain()
+
+    async def serve(self, host="127.0.0.1", port=8000, started=None):
+        """Serve until cancelled. started, if given, is called with the server once it listens."""
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if started is not None:
+            started(server)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8000)),
+                        help="port to listen on (default: $PORT or 8000)")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    tracker = ExpenseTracker(get_spreadsheet, LocalStore())
+    api = ExpenseAPI(tracker)
+    tracker.archive_months()
+    tracker.start_background_sync()
+    tracker.start_background_refresh()
+    print(f"Serving the expense tracker API on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(api.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        api.close()
+        tracker.stop_background_refresh()
+        tracker.stop_background_sync()
+        tracker.dump_metrics()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+import json
+from collections import defaultdict
+
+from aggregates import to_cents
+
+# Closed months are moved out of the expenses worksheet into one worksheet
+# each; the manifest worksheet lists them with their totals
+MANIFEST_SHEET = 'archive'
+MANIFEST_HEADERS = ["Month", "Rows", "Total", "Category Totals"]
+SHARD_PREFIX = 'expenses '
+
+
+def shard_title(month):
+    """Return the worksheet title of an archived (year, month), e.g. 'expenses 2024-01'."""
+    return f"{SHARD_PREFIX}{month[0]:04d}-{month[1]:02d}"
+
+
+def parse_month(text):
+    """Parse a YYYY-MM manifest month into (year, month)."""
+    year, month = text.split("-")
+    return int(year), int(month)
+
+
+class ArchiveManifest:
+    """Row counts and per-category totals of the archived months.
+
+    Totals are kept in integer cents, like ExpenseAggregates, so summaries of
+    archived months are answered without reading their worksheets. The row
+    count of a month is where the next rows archived for it are written.
+    """
+    def __init__(self):
+        self.rows = {}  # (year, month) -> rows in the month's worksheet
+        self.category_totals = {}  # (year, month) -> {category: cents}
+        self.dirty = False  # Changed since last written to the manifest worksheet
+
+    def __contains__(self, month):
+        return month in self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    @property
+    def months(self):
+        """Archived (year, month) tuples, oldest first."""
+        return sorted(self.rows)
+
+    def add(self, month, expenses):
+        """Record expenses archived into month's worksheet."""
+        totals = self.category_totals.setdefault(month, defaultdict(int))
+        for expense in expenses:
+            totals[expense.category] += to_cents(expense.amount)
+        self.rows[month] = self.rows.get(month, 0) + len(expenses)
+        self.dirty = True
+
+    def total_for(self, month):
+        """Return the archived total in euros for a (year, month)."""
+        return sum(self.category_totals.get(month, {}).values()) / 100
+
+    def categories_for(self, month):
+        """Return {category: archived total in euros} for a (year, month)."""
+        return {category: cents / 100 for category, cents in self.category_totals.get(month, {}).items()}
+
+    def months_with(self, category):
+        """Archived (year, month) tuples holding expenses of a category, oldest first."""
+        return [month for month in self.months if category in self.category_totals.get(month, {})]
+
+    def move_category(self, old_name, new_name):
+        """Add the archived totals of category old_name to new_name, as on a rename."""
+        if old_name == new_name:
+            return
+        for totals in self.category_totals.values():
+            cents = totals.pop(old_name, None)
+            if cents is not None:
+                totals[new_name] += cents
+                self.dirty = True
+
+    def to_rows(self):
+        """Return the manifest as worksheet rows, header first."""
+        rows = [MANIFEST_HEADERS]
+        for month in self.months:
+            totals = self.category_totals.get(month, {})
+            rows.append([
+                f"{month[0]:04d}-{month[1]:02d}",
+                self.rows[month],
+                f"{sum(totals.values()) / 100:.2f}",
+                json.dumps({category: cents / 100 for category, cents in totals.items()}),
+            ])
+        return rows
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a manifest from worksheet rows; malformed rows are skipped."""
+        manifest = cls()
+        for row in rows[1:]:
+            try:
+                month = parse_month(row[0])
+                categories = json.loads(row[3]) if len(row) > 3 and row[3] else {}
+                manifest.rows[month] = int(row[1])
+                manifest.category_totals[month] = defaultdict(
+                    int, {category: to_cents(float(amount)) for category, amount in categories.items()}
+                )
+            except (ValueError, IndexError, AttributeError):
+                continue
+        return manifest
@@ -0,0 +1,354 @@
+"""Write monthly statements for many ledgers in one run.
+
+Each source is a Google Sheets URL or a local store snapshot (.db file).
+Ledgers are fetched by a bounded pool of threads that share one rate-limited
+Sheets client, so the whole run stays within the API quota however many
+threads are fetching. Only the rows of the statement month are kept and
+handed to a pool of processes, which parse them, build the pivots and write
+one statement file per ledger. Fetching waits when the processes fall
+behind, so memory stays bounded by the number of ledgers in flight.
+
+Usage: python batch_reports.py ledgers.txt [--month MM-YYYY] [--out statements]
+           [--fetch-workers 16] [--processes N] [--reads-per-minute 60] [--budget 500]
+
+ledgers.txt has one source per line, optionally followed by that ledger's
+monthly budget. Blank lines and lines starting with # are skipped.
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import date
+
+import metrics
+from archive import ArchiveManifest, shard_title
+from local_store import LocalStore
+from run import EXPENSE_HEADERS, EXPENSES_SHEET, READ_PARAMS, Expense, ExpenseTracker, get_client, setup_logging
+
+FETCH_WORKERS = 16  # Ledgers fetched at the same time; the rate limit still applies to all of them
+QUEUED_PER_PROCESS = 2  # Fetched ledgers waiting for each process before fetching pauses
+OUTPUT_DIR = 'statements'
+TOP_N = 5  # Largest expenses listed per category
+
+logger = logging.getLogger("expense_tracker.batch_reports")
+
+
+class Ledger:
+    """The rows of one ledger needed for a month's statement.
+
+    Attributes:
+        source (str): URL or snapshot path the ledger was read from.
+        label (str): name of the statement file, derived from the source.
+        tables (list): worksheet rows, header first, one list per worksheet read.
+        budget (float): monthly budget, or None if unknown.
+        archived_totals (dict): {category: euros} of the month when its rows
+            are archived and were not read, as in local snapshots.
+    """
+    def __init__(self, source, label, budget=None):
+        self.source = source
+        self.label = label
+        self.tables = []
+        self.budget = budget
+        self.archived_totals = {}
+
+
+class BatchResult:
+    """Outcome of a batch run."""
+    def __init__(self):
+        self.written = []  # (source, statement path)
+        self.failed = []  # (source, error message)
+
+    def __str__(self):
+        return f"{len(self.written)} statements written, {len(self.failed)} failed"
+
+
+class Progress:
+    """Thread-safe progress line printed as each ledger finishes."""
+    def __init__(self, total):
+        self.total = total
+        self.finished = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def report(self, source, message):
+        with self.lock:
+            self.finished += 1
+            elapsed = time.monotonic() - self.started
+            rate = self.finished / elapsed if elapsed else 0
+            left = (self.total - self.finished) / rate if rate else 0
+            print(f"[{self.finished}/{self.total}] {source}: {message} "
+                  f"({rate:.1f} ledgers/s, about {left:.0f} s left)")
+
+
+def read_sources(path):
+    """Read (source, budget) pairs from a ledger list file."""
+    sources = []
+    with open(path, encoding='utf-8') as sources_file:
+        for line in sources_file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            parts = line.rsplit(None, 1)
+            budget = ExpenseTracker.parse_amount(parts[1]) if len(parts) == 2 else None
+            sources.append((parts[0], budget) if budget is not None else (line, None))
+    return sources
+
+
+def is_snapshot(source):
+    return not source.startswith(("http://", "https://")) and source.endswith(".db")
+
+
+def source_label(source):
+    """Return a file-name-safe label for a source: the sheet key of a URL, the path of a snapshot."""
+    match = re.search(r"/d/([\w-]+)", source)
+    if match and not is_snapshot(source):
+        return match.group(1)
+    return re.sub(r"[^\w.-]+", "_", os.path.splitext(source)[0]).strip("_")
+
+
+def in_month(rows, month):
+    """Return the header and the rows dated in a (year, month), compared without parsing dates."""
+    if not rows or "Date" not in rows[0]:
+        return rows[:1]
+    column = rows[0].index("Date")
+    wanted = (month[1], month[0])
+    kept = [rows[0]]
+    for row in rows[1:]:
+        if column < len(row):
+            parts = row[column].split("-")
+            try:
+                if len(parts) == 3 and (int(parts[1]), int(parts[2])) == wanted:
+                    kept.append(row)
+            except ValueError:
+                continue
+    return kept
+
+
+def fetch_sheet(spreadsheet, source, month, budget=None):
+    """Read the month's rows of a spreadsheet, from its archive worksheet if the month was archived.
+
+    Two API reads: the spreadsheet metadata, which the rate-limited client
+    shares between opening the spreadsheet and listing its worksheets, and
+    one batched get.
+    """
+    ledger = Ledger(source, source_label(source), budget)
+    with metrics.timed("batch_report", "fetch_sheet") as span:
+        titles = {worksheet.title for worksheet in spreadsheet.worksheets()}
+        ranges = [title for title in (EXPENSES_SHEET, shard_title(month)) if title in titles]
+        response = spreadsheet.values_batch_get([f"'{title}'" for title in ranges], params=READ_PARAMS)
+        for value_range in response.get('valueRanges', []):
+            rows = in_month(value_range.get('values', []), month)
+            span.rows += len(rows) - 1
+            ledger.tables.append(rows)
+    return ledger
+
+
+def fetch_snapshot(path, month, budget=None):
+    """Read the month's rows of a local store snapshot; archived months only have their totals."""
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No such snapshot: {path}")
+    store = LocalStore(path)
+    try:
+        with metrics.timed("batch_report", "fetch_snapshot") as span:
+            rows = [EXPENSE_HEADERS] + [[name, amount, category, date_str]
+                                        for _, name, amount, category, date_str, *_ in store.load_expenses()]
+            ledger = Ledger(path, source_label(path), budget if budget is not None else store.get_setting('budget'))
+            ledger.tables.append(in_month(rows, month))
+            span.rows = len(ledger.tables[0]) - 1
+            manifest = ArchiveManifest.from_rows(store.get_setting('archive_manifest', []))
+            ledger.archived_totals = manifest.categories_for(month)
+    finally:
+        store.close()
+    return ledger
+
+
+def parse_table(rows):
+    """Build Expenses from worksheet rows, header first, skipping invalid rows."""
+    if not rows:
+        return []
+    try:
+        columns = [rows[0].index(header) for header in EXPENSE_HEADERS]
+    except ValueError:
+        return []
+    width = max(columns) + 1
+    expenses = []
+    for row in rows[1:]:
+        row = list(row) + [""] * (width - len(row))
+        amount = ExpenseTracker.parse_amount(row[columns[1]])
+        if amount is None:
+            continue
+        try:
+            expenses.append(Expense(row[columns[0]], amount, row[columns[2]], row[columns[3]]))
+        except ValueError:
+            continue
+    return expenses
+
+
+def write_statement(ledger, month, out_dir, top_n=TOP_N):
+    """Build a ledger's statement for a (year, month) and write it; runs in a worker process.
+
+    Returns:
+        tuple: (statement path, total spent in euros).
+    """
+    # Imported here: NumPy and tabulate are only needed by the workers
+    from tabulate import tabulate
+    from reports import ExpenseColumns, budget_burndown, month_category_pivot, top_expenses
+
+    year, month_number = month
+    expenses = [expense for rows in ledger.tables for expense in parse_table(rows)]
+    columns = ExpenseColumns(expenses)
+    _, categories, cells = month_category_pivot(columns)
+    totals = dict(ledger.archived_totals)
+    for category, amount in zip(categories, cells[0] if len(cells) else []):
+        totals[category] = totals.get(category, 0) + amount
+    total = sum(totals.values())
+
+    lines = [f"Statement for {ledger.label}, {month_number:02d}-{year}", ""]
+    if ledger.budget is None:
+        lines.append(f"Total Expenses: €{total:.2f}")
+    else:
+        lines.append(f"Total Expenses: €{total:.2f} of a €{ledger.budget:.2f} budget "
+                     f"(€{ledger.budget - total:.2f} remaining)")
+    lines += ["", "Spend by Category"]
+    lines.append(tabulate([[category, f"€{amount:.2f}"] for category, amount in sorted(totals.items())],
+                          ["Category", "Amount"], tablefmt="pretty"))
+    if ledger.budget is not None and len(columns):
+        table = [[f"{day:02d}-{month_number:02d}-{year}", f"€{spent:.2f}", f"€{spent_total:.2f}", f"€{left:.2f}"]
+                 for day, spent, spent_total, left in budget_burndown(columns, ledger.budget, year, month_number)]
+        lines += ["", "Budget Burn-down"]
+        lines.append(tabulate(table, ["Date", "Spent", "Month to Date", "Remaining"], tablefmt="pretty"))
+    if len(columns):
+        table = [[category, name, date.fromordinal(day).strftime('%d/%m/%Y'), f"€{amount:.2f}"]
+                 for category, name, day, amount in top_expenses(columns, top_n)]
+        lines += ["", f"Top {top_n} Expenses per Category"]
+        lines.append(tabulate(table, ["Category", "Expense Name", "Date", "Amount"], tablefmt="pretty"))
+
+    path = os.path.join(out_dir, f"{ledger.label}-{year:04d}-{month_number:02d}.txt")
+    with open(path, "w", encoding="utf-8") as statement:
+        statement.write("\n".join(lines) + "\n")
+    return path, total
+
+
+def generate_statements(sources, month, out_dir=OUTPUT_DIR, open_spreadsheet=None,
+                        fetch_workers=FETCH_WORKERS, processes=None, top_n=TOP_N):
+    """Fetch many ledgers concurrently and write a statement for each.
+
+    Args:
+        sources (list): (source, budget) pairs; budget may be None.
+        month (tuple): (year, month) of the statements.
+        open_spreadsheet: callable opening a spreadsheet by URL; defaults to
+            the shared rate-limited client.
+        fetch_workers (int): threads fetching ledgers.
+        processes (int): worker processes building statements; defaults to
+            the number of CPUs.
+
+    Returns:
+        BatchResult: statements written and ledgers that failed.
+    """
+    if open_spreadsheet is None:
+        open_spreadsheet = get_client().open_by_url
+    processes = processes or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+    result = BatchResult()
+    progress = Progress(len(sources))
+    # Fetch threads wait here when the processes fall behind
+    queued = threading.BoundedSemaphore(processes * QUEUED_PER_PROCESS)
+
+    def finished(source, future):
+        queued.release()
+        try:
+            path, total = future.result()
+        except Exception as e:
+            logger.error(f"Error writing the statement of {source}: {e}")
+            result.failed.append((source, str(e)))
+            progress.report(source, f"failed ({e})")
+        else:
+            result.written.append((source, path))
+            progress.report(source, f"€{total:.2f} -> {path}")
+
+    def fetch(source, budget):
+        if is_snapshot(source):
+            ledger = fetch_snapshot(source, month, budget)
+        else:
+            ledger = fetch_sheet(open_spreadsheet(source), source, month, budget)
+        queued.acquire()
+        try:
+            future = workers.submit(write_statement, ledger, month, out_dir, top_n)
+        except Exception:
+            queued.release()
+            raise
+        future.add_done_callback(lambda future: finished(source, future))
+        return future
+
+    # Spawned, not forked: the parent has fetch and logging threads running
+    with ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context("spawn")) as workers, \
+            ThreadPoolExecutor(fetch_workers, thread_name_prefix="batch-fetch") as fetchers:
+        fetches = {fetchers.submit(fetch, source, budget): source for source, budget in sources}
+        for future in as_completed(fetches):
+            error = future.exception()
+            if error is not None:
+                source = fetches[future]
+                logger.error(f"Error fetching {source}: {error}")
+                result.failed.append((source, str(error)))
+                progress.report(source, f"failed to fetch ({error})")
+    return result
+
+
+def parse_month(text):
+    """Parse MM-YYYY into (year, month)."""
+    month, year = (int(part) for part in text.split("-"))
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {text}")
+    return year, month
+
+
+def previous_month():
+    today = date.today()
+    year, month = divmod(today.year * 12 + today.month - 2, 12)
+    return year, month + 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sources", help="file listing one Google Sheets URL or .db snapshot per line")
+    parser.add_argument("--month", help="statement month as MM-YYYY (default: last month)")
+    parser.add_argument("--out", default=OUTPUT_DIR, help="directory the statements are written to (default: %(default)s)")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS,
+                        help="ledgers fetched at the same time (default: %(default)s)")
+    parser.add_argument("--processes", type=int, help="processes building statements (default: one per CPU)")
+    parser.add_argument("--reads-per-minute", type=int,
+                        help="Sheets read quota shared by all fetches (default: the client's 60)")
+    parser.add_argument("--budget", type=float, help="monthly budget of ledgers that don't give one")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    try:
+        month = parse_month(args.month) if args.month else previous_month()
+        sources = [(source, budget if budget is not None else args.budget)
+                   for source, budget in read_sources(args.sources)]
+    except (OSError, ValueError) as e:
+        print(f"Batch reports failed: {e}")
+        return 1
+    open_spreadsheet = None
+    if any(not is_snapshot(source) for source, _ in sources):
+        from sheets_client import BURST, TokenBucket
+
+        client = get_client()
+        if args.reads_per_minute:
+            client.read_bucket = TokenBucket(args.reads_per_minute / 60, BURST)
+        open_spreadsheet = client.open_by_url
+    print(f"Writing {month[1]:02d}-{month[0]} statements for {len(sources)} ledgers to {args.out}/")
+    result = generate_statements(sources, month, args.out, open_spreadsheet, args.fetch_workers, args.processes)
+    print(f"Done: {result}.")
+    for source, error in result.failed:
+        print(f"  {source}: {error}")
+    return 1 if result.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""Load test of the HTTP API against a fake spreadsheet.
+
+Starts the API in this process on a free port, over a tracker backed by a
+FakeSpreadsheet and an in-memory store, and runs --clients concurrent
+keep-alive clients. Each sends --requests requests: mostly reads (filtered
+lists, single expenses, summaries) plus edits that send the version they
+read. Edits go to a small set of hot expenses, so clients race and some get
+409. Reports throughput, latency percentiles and status counts, then checks
+that the sheet matches the ledger once the write-behind worker has saved
+everything.
+
+Usage: python benchmarks/api_load.py [--rows 10000] [--clients 50] [--requests 200] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from contextlib import redirect_stdout
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from api import ExpenseAPI  # noqa: E402
+from fake_sheets import FakeSpreadsheet  # noqa: E402
+from local_store import LocalStore  # noqa: E402
+from run import DATE_FORMAT, Expense, ExpenseTracker, setup_logging  # noqa: E402
+from run_benchmarks import BUDGET, CATEGORIES, SEED, make_sheets  # noqa: E402
+
+HOT_EXPENSES = 20  # Expenses all clients edit, to provoke version conflicts
+
+
+async def http(reader, writer, method, path, body=None):
+    """Send one request on a keep-alive connection; returns (status, JSON body)."""
+    payload = b"" if body is None else json.dumps(body).encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                 + payload)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        key, _, value = line.decode().partition(":")
+        if key.lower() == "content-length":
+            length = int(value)
+    data = await reader.readexactly(length) if length else b""
+    return status, json.loads(data) if data else None
+
+
+async def client(port, number, requests, ids, hot_ids, latencies, statuses):
+    rng = random.Random(SEED + number)
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    today = time.strftime(DATE_FORMAT)
+    for _ in range(requests):
+        choice = rng.random()
+        started = time.perf_counter()
+        if choice < 0.4:
+            status, _ = await http(reader, writer, "GET", f"/expenses?category={rng.choice(CATEGORIES)}&limit=20")
+        elif choice < 0.6:
+            status, _ = await http(reader, writer, "GET", f"/expenses/{rng.choice(ids)}")
+        elif choice < 0.75:
+            status, _ = await http(reader, writer, "GET", "/summary")
+        elif choice < 0.97:
+            expense_id = rng.choice(hot_ids)
+            status, expense = await http(reader, writer, "GET", f"/expenses/{expense_id}")
+            if status == 200:
+                status, _ = await http(reader, writer, "PATCH", f"/expenses/{expense_id}",
+                                       {"version": expense["version"], "amount": round(expense["amount"] + 1, 2)})
+        else:
+            status, _ = await http(reader, writer, "POST", "/expenses", {
+                "name": f"API expense {number}", "amount": 4.5, "category": rng.choice(CATEGORIES), "date": today,
+            })
+        latencies.append(time.perf_counter() - started)
+        statuses[status] += 1
+    writer.close()
+
+
+async def load(api, clients, requests, ids, hot_ids):
+    server = await asyncio.start_server(api.handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+    statuses = Counter()
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(client(port, number, requests, ids, hot_ids, latencies, statuses)
+                               for number in range(clients)))
+    return time.perf_counter() - started, latencies, statuses
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000, help="expenses in the ledger (default: %(default)s)")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients (default: %(default)s)")
+    parser.add_argument("--requests", type=int, default=200, help="requests per client (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of simulated latency per API call")
+    args = parser.parse_args(argv)
+    # Every Sheets call logs a metric; keep them out of the app's log file
+    setup_logging(os.devnull)
+
+    spreadsheet = FakeSpreadsheet(make_sheets(args.rows), args.latency)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        tracker = ExpenseTracker(spreadsheet, LocalStore(":memory:"), budget=BUDGET)
+    tracker.start_background_sync()
+    api = ExpenseAPI(tracker)
+    ids = [expense.id for expense in tracker.expenses]
+    hot_ids = random.Random(SEED).sample(ids, HOT_EXPENSES)
+
+    elapsed, latencies, statuses = asyncio.run(load(api, args.clients, args.requests, ids, hot_ids))
+    api.close()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        tracker.stop_background_sync()
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"{total} requests from {args.clients} clients in {elapsed:.2f} s ({total / elapsed:.0f} requests/s)")
+    print("latency: " + ", ".join(f"p{round(q * 100)} {latencies[min(total - 1, int(q * total))] * 1000:.1f} ms"
+                                  for q in (0.5, 0.95, 0.99)))
+    print("statuses: " + ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items())))
+    print(f"Sheets API calls: {spreadsheet.call_count} ({', '.join(f'{n} {c}' for n, c in spreadsheet.calls.items())})")
+
+    sheet = [Expense.fingerprint_of(row) for row in spreadsheet.sheets["expenses"].rows[1:]]
+    ledger = [expense.fingerprint() for expense in tracker.expenses]
+    consistent = sheet == ledger and not tracker.has_pending_changes()
+    print(f"sheet matches ledger: {'yes' if consistent else 'NO'}")
+    return 0 if consistent else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Load test of batch statement generation over many fake spreadsheets.
+
+Builds --ledgers FakeSpreadsheets of --rows expenses each, with --latency
+seconds per API call, and writes last month's statement for every one of
+them into a temporary directory. Reports the wall time next to the time the
+same fetches would take one after another, and the Sheets calls made.
+
+Usage: python benchmarks/batch_load.py [--ledgers 500] [--rows 2000] [--latency 0.1] [--fetch-workers 16] [--processes N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from batch_reports import FETCH_WORKERS, generate_statements, previous_month  # noqa: E402
+from fake_sheets import FakeSpreadsheet  # noqa: E402
+from run import setup_logging  # noqa: E402
+from run_benchmarks import BUDGET, SEED, make_sheets  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ledgers", type=int, default=500, help="spreadsheets to report on (default: %(default)s)")
+    parser.add_argument("--rows", type=int, default=2000, help="expenses per spreadsheet (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.1, help="seconds of simulated latency per API call")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS, help="fetch threads (default: %(default)s)")
+    parser.add_argument("--processes", type=int, help="statement processes (default: one per CPU)")
+    args = parser.parse_args(argv)
+    # Every Sheets call logs a metric; keep them out of the app's log file
+    setup_logging(os.devnull)
+
+    spreadsheets = {f"https://docs.google.com/spreadsheets/d/ledger{number}":
+                    FakeSpreadsheet(make_sheets(args.rows, SEED + number), args.latency)
+                    for number in range(args.ledgers)}
+    sources = [(url, BUDGET) for url in spreadsheets]
+    with tempfile.TemporaryDirectory() as out_dir:
+        started = time.perf_counter()
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            result = generate_statements(sources, previous_month(), out_dir, spreadsheets.__getitem__,
+                                         args.fetch_workers, args.processes)
+        elapsed = time.perf_counter() - started
+        written = len(os.listdir(out_dir))
+
+    calls = sum(spreadsheet.call_count for spreadsheet in spreadsheets.values())
+    print(f"{result} for {args.ledgers} ledgers of {args.rows} rows in {elapsed:.2f} s "
+          f"({args.ledgers / elapsed:.1f} ledgers/s)")
+    print(f"Sheets API calls: {calls} ({calls / args.ledgers:.1f} per ledger); "
+          f"one after another they would wait {calls * args.latency:.1f} s on the network alone")
+    return 0 if written == args.ledgers and not result.failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""In-memory stand-ins for gspread's Spreadsheet and Worksheet.
+
+Only the calls the tracker makes are implemented. Each call is counted by
+name in FakeSpreadsheet.calls and sleeps for the configured latency, so a
+benchmark sees both the number of round-trips and their cost.
+"""
+import re
+import time
+from collections import Counter
+
+_READS = ("get_all_values", "col_values", "batch_get", "values_batch_get", "worksheets", "worksheet", "drive_metadata")
+_CELL = re.compile(r"([A-Z]+)(\d+)?")
+
+
+def _parse_cell(a1):
+    """Return (row, column) of an A1 reference; row is None for a whole column."""
+    letters, row = _CELL.fullmatch(a1).groups()
+    column = 0
+    for letter in letters:
+        column = column * 26 + ord(letter) - ord("A") + 1
+    return (int(row) if row else None), column
+
+
+def _parse_range(range_name):
+    """Return (first row, first column, last row, last column) of an A1 range."""
+    range_name = range_name.split("!")[-1]
+    start, _, end = range_name.partition(":")
+    first_row, first_column = _parse_cell(start)
+    if not end:
+        return first_row, first_column, first_row, first_column
+    last_row, last_column = _parse_cell(end)
+    return first_row or 1, first_column, last_row, last_column
+
+
+def _column_letter(column):
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+class FakeWorksheet:
+    """A worksheet whose cells are a list of rows of strings."""
+    def __init__(self, spreadsheet, title, rows, sheet_id):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = [[str(value) for value in row] for row in rows]
+
+    @property
+    def row_count(self):
+        return max(len(self.rows), 1000)
+
+    def _read(self, range_name):
+        first_row, first_column, last_row, last_column = _parse_range(range_name)
+        last_row = len(self.rows) if last_row is None else last_row
+        return [row[first_column - 1:last_column] for row in self.rows[first_row - 1:last_row]]
+
+    def _write(self, range_name, values):
+        first_row, first_column, _, _ = _parse_range(range_name)
+        for row_offset, row_values in enumerate(values):
+            row_number = first_row + row_offset
+            while len(self.rows) < row_number:
+                self.rows.append([])
+            row = self.rows[row_number - 1]
+            for column_offset, value in enumerate(row_values):
+                index = first_column - 1 + column_offset
+                while len(row) < index + 1:
+                    row.append("")
+                row[index] = "" if value is None else str(value)
+
+    def get_all_values(self):
+        self.spreadsheet.record("get_all_values")
+        return [list(row) for row in self.rows]
+
+    def col_values(self, column):
+        self.spreadsheet.record("col_values")
+        values = [row[column - 1] if len(row) >= column else "" for row in self.rows]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def batch_get(self, ranges, **kwargs):
+        self.spreadsheet.record("batch_get")
+        return [self._read(range_name) for range_name in ranges]
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.spreadsheet.record("update")
+        self._write(range_name, values)
+
+    def batch_update(self, data, **kwargs):
+        self.spreadsheet.record("batch_update")
+        for item in data:
+            self._write(item["range"], item["values"])
+
+    def batch_clear(self, ranges):
+        self.spreadsheet.record("batch_clear")
+        for range_name in ranges:
+            first_row, first_column, last_row, last_column = _parse_range(range_name)
+            last_row = len(self.rows) if last_row is None else min(last_row, len(self.rows))
+            for row in self.rows[first_row - 1:last_row]:
+                for index in range(first_column - 1, min(last_column, len(row))):
+                    row[index] = ""
+
+    def append_rows(self, values, **kwargs):
+        self.spreadsheet.record("append_rows")
+        while self.rows and not any(self.rows[-1]):
+            self.rows.pop()
+        first_row = len(self.rows) + 1
+        self.rows.extend([["" if value is None else str(value) for value in row] for row in values])
+        width = max((len(row) for row in values), default=1)
+        updated_range = f"'{self.title}'!A{first_row}:{_column_letter(width)}{len(self.rows)}"
+        return {"updates": {"updatedRange": updated_range}}
+
+
+class FakeSpreadsheet:
+    """A spreadsheet of FakeWorksheets that counts and delays every API call.
+
+    Args:
+        sheets (dict): worksheet title -> list of rows (header first).
+        latency (float): seconds each API call sleeps, simulating a round-trip.
+    """
+    def __init__(self, sheets, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.revision = 0  # Bumped by every write; stands in for the Drive modifiedTime
+        self.sheets = {title: FakeWorksheet(self, title, rows, sheet_id)
+                       for sheet_id, (title, rows) in enumerate(sheets.items())}
+
+    def record(self, name):
+        """Count an API call and wait out the simulated latency."""
+        self.calls[name] += 1
+        if name not in _READS:
+            self.touch()
+        if self.latency:
+            time.sleep(self.latency)
+
+    def touch(self):
+        """Mark the spreadsheet modified, e.g. after editing rows directly."""
+        self.revision += 1
+
+    @property
+    def lastUpdateTime(self):
+        return str(self.revision)
+
+    def refresh_lastUpdateTime(self):
+        self.record("drive_metadata")
+
+    @property
+    def call_count(self):
+        return sum(self.calls.values())
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    def worksheets(self):
+        self.record("worksheets")
+        return list(self.sheets.values())
+
+    def worksheet(self, title):
+        self.record("worksheet")
+        return self.sheets[title]
+
+    def values_batch_get(self, ranges, params=None):
+        self.record("values_batch_get")
+        value_ranges = []
+        for range_name in ranges:
+            title, _, cells = range_name.rpartition("!")
+            worksheet = self.sheets[(title or cells).strip("'")]
+            values = worksheet._read(cells) if title else [list(row) for row in worksheet.rows]
+            value_ranges.append({"range": range_name, "values": values} if values else {"range": range_name})
+        return {"valueRanges": value_ranges}
+
+    def values_batch_update(self, params=None, body=None):
+        self.record("values_batch_update")
+        for item in body["data"]:
+            title, _, cells = item["range"].rpartition("!")
+            self.sheets[title.strip("'")]._write(cells, item["values"])
+        return {"totalUpdatedRows": sum(len(item["values"]) for item in body["data"])}
+
+    def batch_update(self, body):
+        self.record("spreadsheet.batch_update")
+        worksheets = {worksheet.id: worksheet for worksheet in self.sheets.values()}
+        replies = []
+        # Requests apply in order, as in the Sheets API
+        for request in body["requests"]:
+            reply = {}
+            if "addSheet" in request:
+                title = request["addSheet"]["properties"]["title"]
+                worksheet = self.sheets[title] = FakeWorksheet(self, title, [], max(worksheets, default=-1) + 1)
+                worksheets[worksheet.id] = worksheet
+                reply = {"addSheet": {"properties": {"title": title, "sheetId": worksheet.id}}}
+            elif "deleteDimension" in request:
+                dimension = request["deleteDimension"]["range"]
+                worksheet = worksheets[dimension["sheetId"]]
+                del worksheet.rows[dimension["startIndex"]:dimension["endIndex"]]
+            # appendDimension only grows the grid, which isn't modelled
+            replies.append(reply)
+        return {"replies": replies}
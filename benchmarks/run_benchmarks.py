@@ -0,0 +1,224 @@
+"""Offline benchmarks of the expense tracker against a fake spreadsheet.
+
+Each scenario runs on a fresh tracker loaded from a FakeSpreadsheet of the
+given size and reports wall time, the number of Sheets API calls and the
+peak memory allocated while it ran. Wall time and call count come from an
+untraced run; peak memory from a second run under tracemalloc, which would
+otherwise slow the timing down.
+
+Usage: python benchmarks/run_benchmarks.py [--sizes 100,10000] [--latency 0.05] [--json] [--metrics PATH]
+"""
+import argparse
+import builtins
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import metrics  # noqa: E402
+import tabulate  # noqa: E402,F401  Imported lazily by run.py; loaded here so it isn't timed
+from fake_sheets import FakeSpreadsheet  # noqa: E402
+from importer import CategoryRules, import_expenses  # noqa: E402
+from run import (  # noqa: E402
+    CATEGORIES_SHEET, CATEGORY_HEADERS, DATE_FORMAT, EXPENSE_HEADERS, EXPENSES_SHEET, Expense, ExpenseTracker,
+    setup_logging,
+)
+
+SIZES = (100, 10_000, 100_000)
+CATEGORIES = ["Groceries", "Rent", "Transport", "Utilities", "Dining", "Health", "Travel", "Gifts", "Hobbies", "Other"]
+CHANGED_FRACTION = 0.01  # Share of rows edited, added and removed by the save scenario
+IMPORT_FRACTION = 0.1  # Bank statement lines per ledger row in the import scenario; 10% are duplicates
+BUDGET = 1000.0
+SEED = 12
+
+
+def make_sheets(rows, seed=SEED):
+    """Worksheet contents for a ledger of the given number of expense rows."""
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=3 * 365)
+    expenses = [EXPENSE_HEADERS]
+    for i in range(rows):
+        day = first_day + timedelta(days=rng.randrange(3 * 365))
+        expenses.append([f"Expense {i}", f"{rng.uniform(1, 200):.2f}", rng.choice(CATEGORIES), day.strftime(DATE_FORMAT)])
+    return {EXPENSES_SHEET: expenses, CATEGORIES_SHEET: [CATEGORY_HEADERS] + [[name] for name in CATEGORIES]}
+
+
+@contextmanager
+def quiet(answers=("q",)):
+    """Discard printed output and answer input() prompts from answers."""
+    replies = iter(answers)
+    original_input = builtins.input
+    builtins.input = lambda prompt="": next(replies, "q")
+    try:
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            yield
+    finally:
+        builtins.input = original_input
+
+
+def prepare_load(tracker):
+    return tracker.load_expenses
+
+
+def prepare_load_archived(tracker):
+    tracker.archive_closed_months()
+    return tracker.load_expenses
+
+
+def prepare_save(tracker):
+    rng = random.Random(SEED)
+    changes = max(1, int(len(tracker.expenses) * CHANGED_FRACTION))
+    for expense in rng.sample(tracker.expenses, changes):
+        tracker.update_expense(expense, amount=round(expense.amount + 1, 2))
+    for index in sorted(rng.sample(range(len(tracker.expenses)), changes), reverse=True):
+        tracker.remove_expense(index)
+    today = date.today().strftime(DATE_FORMAT)
+    for i in range(changes):
+        tracker.add_expense(Expense(f"New expense {i}", 9.99, rng.choice(CATEGORIES), today))
+    return tracker.save_expenses
+
+
+def prepare_save_unchanged(tracker):
+    return tracker.save_expenses
+
+
+def prepare_summarize(tracker):
+    return tracker.summarize_expenses
+
+
+def prepare_display(tracker):
+    return tracker.display_expenses
+
+
+def prepare_display_filtered(tracker):
+    start = date.today() - timedelta(days=90)
+    return lambda: tracker.display_expenses(tracker.filter_expenses(start=start, category=CATEGORIES[0]))
+
+
+def prepare_refresh_unchanged(tracker):
+    tracker.refresh_from_sheet()
+    return tracker.refresh_from_sheet
+
+
+def prepare_refresh(tracker):
+    tracker.refresh_from_sheet()
+    rng = random.Random(SEED)
+    worksheet = tracker.expense_sheet
+    changes = max(1, int(len(tracker.expenses) * CHANGED_FRACTION))
+    # Another editor changes some amounts and adds rows at the end
+    rows = rng.sample(range(2, len(worksheet.rows) + 1), changes)
+    worksheet.batch_update([{"range": f"B{row}", "values": [[f"{rng.uniform(1, 200):.2f}"]]} for row in rows])
+    today = date.today().strftime(DATE_FORMAT)
+    worksheet.append_rows([[f"Remote expense {i}", "4.20", rng.choice(CATEGORIES), today] for i in range(changes)])
+    return tracker.refresh_from_sheet
+
+
+def prepare_archive(tracker):
+    return tracker.archive_closed_months
+
+
+def prepare_summarize_archived(tracker):
+    tracker.archive_closed_months()
+    today = date.today()
+    return lambda: tracker.summarize_expenses((today.year - 1, today.month))
+
+
+def prepare_rename_category(tracker):
+    # Every expense of the category is rewritten, with the category list, by one save
+    def rename():
+        tracker.rename_category(0, "Renamed")
+        tracker.save_expenses()
+    return rename
+
+
+def prepare_import(tracker):
+    rng = random.Random(SEED)
+    lines = max(100, int(len(tracker.expenses) * IMPORT_FRACTION))
+    statement = io.StringIO()
+    statement.write("Date,Description,Amount\n")
+    for i in range(lines):
+        if i % 10 == 0 and tracker.expenses:
+            expense = rng.choice(tracker.expenses)  # Already in the ledger
+            statement.write(f"{expense.date_str()},{expense.name},-{expense.amount:.2f}\n")
+        else:
+            statement.write(f"{tracker.expenses[0].date_str()},Card payment {i},-{rng.uniform(1, 200):.2f}\n")
+    rules = CategoryRules([("payment", CATEGORIES[0])], tracker.expense_categories, default=CATEGORIES[-1])
+    return lambda: import_expenses(tracker, io.StringIO(statement.getvalue()), rules, signed=True)
+
+
+SCENARIOS = [
+    ("load_expenses", prepare_load),
+    ("load_expenses (after archiving)", prepare_load_archived),
+    ("save_expenses", prepare_save),
+    ("save_expenses (no changes)", prepare_save_unchanged),
+    ("summarize_expenses", prepare_summarize),
+    ("summarize_expenses (archived month)", prepare_summarize_archived),
+    ("display_expenses", prepare_display),
+    ("display_expenses (filtered)", prepare_display_filtered),
+    ("refresh_from_sheet (no changes)", prepare_refresh_unchanged),
+    ("refresh_from_sheet", prepare_refresh),
+    ("rename_category", prepare_rename_category),
+    ("import_expenses (csv)", prepare_import),
+    ("archive_closed_months", prepare_archive),
+]
+
+
+def run_scenario(sheets, prepare, latency, trace_memory):
+    """Run one scenario on a fresh tracker; returns (seconds, API calls, peak bytes)."""
+    spreadsheet = FakeSpreadsheet(sheets, latency)
+    with quiet():
+        tracker = ExpenseTracker(spreadsheet, budget=BUDGET)
+        operation = prepare(tracker)
+        spreadsheet.reset_calls()
+        if trace_memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        operation()
+        elapsed = time.perf_counter() - started
+        peak = None
+        if trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return elapsed, spreadsheet.call_count, peak
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES),
+                        help="comma-separated ledger sizes (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of simulated latency per API call")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="also write the metrics registry to PATH (.prom for Prometheus text, else JSON)")
+    args = parser.parse_args(argv)
+    # Every Sheets call logs a metric; keep them out of the app's log file
+    setup_logging(os.devnull)
+
+    results = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        sheets = make_sheets(size)
+        for name, prepare in SCENARIOS:
+            elapsed, calls, _ = run_scenario(sheets, prepare, args.latency, trace_memory=False)
+            peak = None if args.no_memory else run_scenario(sheets, prepare, args.latency, trace_memory=True)[2]
+            results.append({"scenario": name, "rows": size, "seconds": elapsed, "api_calls": calls, "peak_bytes": peak})
+            if not args.json:
+                memory = "-" if peak is None else f"{peak / 1024:.0f} KiB"
+                print(f"{name:<36} {size:>8} rows {elapsed * 1000:>10.1f} ms {calls:>4} calls {memory:>12}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    if args.metrics:
+        metrics.REGISTRY.dump(args.metrics)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Check that importing run.py stays fast and free of heavy dependencies.
+
+Runs `python -X importtime -c "import run"` in a fresh interpreter and fails
+if the cumulative import time of run.py exceeds IMPORT_BUDGET_MS (best of
+RUNS) or if any of the lazily loaded packages were imported.
+
+Usage: python benchmarks/startup.py
+"""
+import os
+import subprocess
+import sys
+
+IMPORT_BUDGET_MS = 100  # Cumulative import time allowed for run.py
+RUNS = 5
+# Only needed once the tracker talks to Google Sheets or prints reports
+LAZY_MODULES = ("gspread", "google.oauth2", "google.auth", "tabulate", "numpy")
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure():
+    """Import run.py once; returns (cumulative ms, {module: cumulative ms})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import run"],
+        cwd=REPO_DIR, capture_output=True, text=True, check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == "site":
+            # Everything so far was interpreter startup, not run.py
+            modules.clear()
+        elif cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative) / 1000
+    return modules["run"], modules
+
+
+def main():
+    # The first run also writes the .pyc files; keep the best time
+    timings = [measure() for _ in range(RUNS)]
+    elapsed, modules = min(timings, key=lambda timing: timing[0])
+    print(f"import run: {elapsed:.1f} ms (budget {IMPORT_BUDGET_MS} ms, best of {RUNS})")
+    for name, ms in sorted(modules.items(), key=lambda item: item[1], reverse=True)[:10]:
+        print(f"  {ms:8.1f} ms  {name}")
+
+    failures = []
+    if elapsed > IMPORT_BUDGET_MS:
+        failures.append(f"import took {elapsed:.1f} ms, over the {IMPORT_BUDGET_MS} ms budget")
+    eager = [name for name in modules
+             if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)]
+    if eager:
+        failures.append(f"imported at startup: {', '.join(sorted(eager))}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import sys
+
+
+class CategoryRegistry:
+    """Expense categories with stable integer ids.
+
+    Expenses refer to their category by id (Expense.category_id) and keep the
+    interned name only for writing their row. Ids are never reused, so a
+    rename changes the name held for an id and nothing that is keyed by it.
+    The listed categories are the ones of the categories worksheet, in its
+    order; names only seen on expense rows get an id but are not listed.
+
+    Iterating, indexing and len() cover the listed names, as on the plain
+    list this replaces; membership and id lookups are O(1).
+    """
+    def __init__(self, names=()):
+        self._names = []  # id -> name
+        self._ids = {}  # name -> id
+        self._order = []  # ids of the listed categories, in worksheet order
+        self._listed = set()
+        self.replace(names)
+
+    def __iter__(self):
+        return (self._names[category_id] for category_id in self._order)
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index):
+        return self._names[self._order[index]]
+
+    def __contains__(self, name):
+        return self._ids.get(name) in self._listed
+
+    def intern(self, name):
+        """Return the id of a category name, giving new names an id."""
+        category_id = self._ids.get(name)
+        if category_id is None:
+            category_id = len(self._names)
+            name = sys.intern(name)
+            self._names.append(name)
+            self._ids[name] = category_id
+        return category_id
+
+    def id_of(self, name):
+        """Return the id of a category name, or None if it has none."""
+        return self._ids.get(name)
+
+    def name_of(self, category_id):
+        return self._names[category_id]
+
+    def id_at(self, index):
+        """Return the id of the listed category at index."""
+        return self._order[index]
+
+    def index(self, name):
+        """Return the position of a listed category; ValueError if it is not listed."""
+        if name not in self:
+            raise ValueError(f"No category {name}")
+        return self._order.index(self._ids[name])
+
+    def bind(self, expense):
+        """Point an expense at the id of its category name, sharing one name string per category."""
+        expense.category_id = self.intern(expense.category)
+        expense.category = self._names[expense.category_id]
+
+    def append(self, name):
+        """List a new category; ValueError if it is already listed."""
+        if name in self:
+            raise ValueError(f"Category {name} already exists")
+        category_id = self.intern(name)
+        self._order.append(category_id)
+        self._listed.add(category_id)
+
+    def rename(self, category_id, new_name):
+        """Give a category a new name.
+
+        The new name must not be listed already. If it was only seen on
+        expense rows, it now resolves to category_id; the caller moves the
+        expenses filed under its old id.
+        """
+        if new_name in self:
+            raise ValueError(f"Category {new_name} already exists")
+        del self._ids[self._names[category_id]]
+        new_name = sys.intern(new_name)
+        self._names[category_id] = new_name
+        self._ids[new_name] = category_id
+
+    def remove(self, category_id):
+        """Unlist a category. Its id keeps its name for expenses still filed under it."""
+        self._order.remove(category_id)
+        self._listed.discard(category_id)
+
+    def replace(self, names):
+        """List exactly these names, in this order; duplicates are listed once."""
+        self._order = []
+        self._listed = set()
+        for name in names:
+            category_id = self.intern(name)
+            if category_id not in self._listed:
+                self._order.append(category_id)
+                self._listed.add(category_id)
+
+    def names(self):
+        """Return the listed names as a list."""
+        return [self._names[category_id] for category_id in self._order]
@@ -0,0 +1,81 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+
+
+class ExpenseIndex:
+    """Date and category indexes used to filter the ledger without a full scan.
+
+    Expenses are keyed by id() of the Expense object. The date index is a
+    sorted list of (date ordinal, key) pairs searched with bisect; the category
+    index maps each category id to the set of keys filed under it. Like
+    ExpenseAggregates, callers remove an expense before changing its date or
+    category and add it again afterwards.
+    """
+    def __init__(self, expenses=()):
+        self.expenses = {}
+        self.dates = sorted((expense.date.toordinal(), id(expense)) for expense in expenses)
+        self.categories = defaultdict(set)
+        for expense in expenses:
+            self.expenses[id(expense)] = expense
+            self.categories[expense.category_id].add(id(expense))
+
+    def add(self, expense):
+        """Index an expense."""
+        key = id(expense)
+        self.expenses[key] = expense
+        insort(self.dates, (expense.date.toordinal(), key))
+        self.categories[expense.category_id].add(key)
+
+    def remove(self, expense):
+        """Drop an expense from the indexes."""
+        key = id(expense)
+        del self.expenses[key]
+        del self.dates[bisect_left(self.dates, (expense.date.toordinal(), key))]
+        keys = self.categories[expense.category_id]
+        keys.discard(key)
+        if not keys:
+            del self.categories[expense.category_id]
+
+    def move_category(self, old_id, new_id):
+        """File the expenses of category old_id under new_id."""
+        if old_id != new_id and old_id in self.categories:
+            self.categories[new_id] |= self.categories.pop(old_id)
+
+    def category(self, category_id):
+        """Return the expenses filed under a category id."""
+        return [self.expenses[key] for key in self.categories.get(category_id, ())]
+
+    def date_range(self, start=None, end=None):
+        """Return keys of expenses dated start..end inclusive, in date order."""
+        low = 0 if start is None else bisect_left(self.dates, (start.toordinal(),))
+        high = len(self.dates) if end is None else bisect_right(self.dates, (end.toordinal(), float('inf')))
+        return [key for _, key in self.dates[low:high]]
+
+    def search(self, start=None, end=None, category_id=None, name=None, min_amount=None, max_amount=None):
+        """Yield matching expenses in date order.
+
+        Date and category filters are answered from the indexes; the name
+        substring (case-insensitive) and amount range are checked only on the
+        expenses those filters leave.
+        """
+        if category_id is not None:
+            # Only the category's own expenses are looked at, never the whole ledger
+            matches = self.category(category_id)
+            if start is not None:
+                matches = [expense for expense in matches if expense.date.date() >= start]
+            if end is not None:
+                matches = [expense for expense in matches if expense.date.date() <= end]
+            keys = [id(expense) for expense in sorted(matches, key=lambda expense: expense.date)]
+        else:
+            keys = self.date_range(start, end)
+
+        name = name.lower() if name else None
+        for key in keys:
+            expense = self.expenses[key]
+            if name is not None and name not in expense.name.lower():
+                continue
+            if min_amount is not None and expense.amount < min_amount:
+                continue
+            if max_amount is not None and expense.amount > max_amount:
+                continue
+            yield expense
@@ -0,0 +1,393 @@
+"""Import expenses from a CSV file, such as a monthly bank statement export.
+
+The file is streamed: rows are parsed, validated, categorised and checked for
+duplicates one at a time by a chain of generators, and handed on in chunks of
+CHUNK_ROWS. Each chunk is added to the ledger and appended to the expenses
+worksheet in one write before the next one is read, so the importer holds one
+chunk at a time whatever the size of the file.
+
+Usage: python importer.py statement.csv [--rules rules.csv] [--default-category Other] [--signed] [--dry-run]
+"""
+import argparse
+import csv
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from functools import lru_cache
+from itertools import islice
+
+import metrics
+from aggregates import to_cents
+from local_store import LocalStore
+from run import Expense, ExpenseTracker, get_spreadsheet, setup_logging
+
+CHUNK_ROWS = 1000  # Rows validated, stored and appended to the sheet per batch
+RULES_FILE = 'import_rules.csv'  # Category rules used when --rules is not given
+MAX_ERRORS = 20  # Rejected rows kept for the report; the rest are only counted
+SNIFF_BYTES = 8192
+# Header names recognised for each expense field, compared case-insensitively
+COLUMN_ALIASES = {
+    "Expense Name": ("expense name", "name", "description", "details", "payee", "merchant", "narrative", "memo"),
+    "Amount": ("amount", "debit", "value"),
+    "Category": ("category",),
+    "Date": ("date", "transaction date", "booking date", "posting date", "value date"),
+}
+REQUIRED_COLUMNS = ("Expense Name", "Amount", "Date")
+
+logger = logging.getLogger("expense_tracker.importer")
+
+
+class ArchiveUnavailable(Exception):
+    """An archived month could not be read to check the file's rows against it."""
+
+
+class ImportResult:
+    """What an import did with the rows of a file."""
+    def __init__(self):
+        self.imported = 0
+        self.duplicates = 0  # Rows already in the ledger
+        self.credits = 0  # Incoming payments skipped in signed statements
+        self.rejected = 0
+        self.errors = []  # (line number, reason) of the first MAX_ERRORS rejected rows
+        self.upload_failed = False
+        self.stopped = None  # Why the import ended before the end of the file
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, reason))
+        logger.warning(f"Line {line} not imported: {reason}")
+
+    def __str__(self):
+        text = f"{self.imported} imported, {self.duplicates} duplicates skipped, {self.rejected} rejected"
+        return text + (f", {self.credits} credits skipped" if self.credits else "")
+
+
+class CategoryRules:
+    """Ordered rule table mapping expense descriptions to categories.
+
+    Each rule is a case-insensitive regular expression searched in the
+    description; the first matching rule gives the category. Rules naming a
+    category that does not exist are ignored.
+
+    Args:
+        rules (list): (pattern, category) pairs.
+        categories (list): the tracker's expense categories.
+        default (str): category of descriptions no rule matches, or None to
+            reject them.
+    """
+    def __init__(self, rules, categories, default=None):
+        self.categories = {category.casefold(): category for category in categories}
+        self.rules = []
+        for pattern, category in rules:
+            name = self.categories.get(category.strip().casefold())
+            if name is None:
+                logger.warning(f"Ignoring rule {pattern!r}: unknown category {category!r}")
+                continue
+            self.rules.append((re.compile(pattern, re.IGNORECASE), name))
+        self.default = self.known(default) if default else None
+        if default and self.default is None:
+            raise ValueError(f"Unknown default category: {default}")
+        # Statements repeat the same payees; bounded so memory stays flat
+        self.categorize = lru_cache(maxsize=4096)(self._categorize)
+
+    def known(self, category):
+        """Return the tracker's spelling of a category name, or None if there is no such category."""
+        return self.categories.get(category.strip().casefold())
+
+    def _categorize(self, description):
+        for pattern, category in self.rules:
+            if pattern.search(description):
+                return category
+        return self.default
+
+
+def load_rules(path):
+    """Read (pattern, category) rules from a two-column CSV file.
+
+    A "pattern,category" header row, blank lines and lines starting with #
+    are skipped.
+    """
+    rules = []
+    with open(path, newline='', encoding='utf-8-sig') as rules_file:
+        for row in csv.reader(rules_file):
+            if not row or not row[0].strip() or row[0].lstrip().startswith("#"):
+                continue
+            if [value.strip().casefold() for value in row[:2]] == ["pattern", "category"]:
+                continue
+            if len(row) < 2:
+                raise ValueError(f"Rule without a category in {path}: {row}")
+            rules.append((row[0].strip(), row[1].strip()))
+    return rules
+
+
+def open_statement(csv_file):
+    """Return a csv reader for a statement, guessing its delimiter.
+
+    Returns:
+        tuple: (reader, decimal_comma). Semicolon-separated exports use a
+            decimal comma, so their 1.234 is a thousand and 1,234 a decimal.
+    """
+    sample = csv_file.read(SNIFF_BYTES)
+    csv_file.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    return csv.reader(csv_file, dialect), dialect.delimiter == ";"
+
+
+def map_columns(header_row):
+    """Return {expense field: column index} for a statement's header row."""
+    headers = [header.strip().casefold() for header in header_row]
+    columns = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in headers:
+                columns[field] = headers.index(alias)
+                break
+    missing = [field for field in REQUIRED_COLUMNS if field not in columns]
+    if missing:
+        raise ValueError(f"No {', '.join(missing)} column found in the header row: {header_row}")
+    return columns
+
+
+def parse_amount(value, decimal_comma=False):
+    """Convert an amount cell to a float, or None if it is not a number.
+
+    The separators are read from the value itself. With both ',' and '.',
+    the last one is the decimal point (1.234,50 or 1,234.50). A separator
+    followed by one or two digits is the decimal point (3,50 or 12.5). Only
+    groups of three digits are ambiguous: they are thousands when the
+    separator is the file's thousands separator ('.' with decimal_comma,
+    ',' otherwise), and decimals when it appears once otherwise. Anything
+    else, such as 1,2,3, is not a number.
+    """
+    comma, dot = value.rfind(','), value.rfind('.')
+    if comma != -1 and dot != -1:
+        decimal = ',' if comma > dot else '.'
+        value = value.replace('.' if decimal == ',' else ',', '').replace(decimal, '.')
+    elif comma != -1 or dot != -1:
+        separator = ',' if comma != -1 else '.'
+        whole, *groups = value.split(separator)
+        if separator == ('.' if decimal_comma else ',') and all(len(group.rstrip()) == 3 for group in groups):
+            value = whole + "".join(groups)
+        elif len(groups) == 1:
+            value = f"{whole}.{groups[0]}"
+        else:
+            return None
+    return ExpenseTracker.parse_amount(value)
+
+
+def normalize_date(value):
+    """Return a date as DD-MM-YYYY, accepting / and . as separators."""
+    value = value.strip().replace('/', '-').replace('.', '-')
+    Expense.validate_date(value)
+    return value
+
+
+def parse_rows(reader, rules, result, signed=False, decimal_comma=False):
+    """Yield an Expense for each valid row of a statement.
+
+    Rows that fail validation are counted in result and skipped.
+
+    Args:
+        reader: csv reader positioned at the header row.
+        rules (CategoryRules): maps descriptions to categories.
+        signed (bool): amounts are signed as on a bank statement; negative
+            amounts are expenses and positive ones (income, refunds) are skipped.
+        decimal_comma (bool): amounts are written as 1.234,50; see parse_amount.
+    """
+    header_row = next(reader, None)
+    if header_row is None:
+        return
+    columns = map_columns(header_row)
+    name_column = columns["Expense Name"]
+    amount_column = columns["Amount"]
+    date_column = columns["Date"]
+    category_column = columns.get("Category")
+    width = max(columns.values()) + 1
+
+    for row in reader:
+        line = reader.line_num
+        if not any(row):
+            continue
+        if len(row) < width:
+            row = row + [""] * (width - len(row))
+        name = row[name_column].strip()
+        if not name:
+            result.reject(line, "no description")
+            continue
+        amount = parse_amount(row[amount_column], decimal_comma)
+        if amount is None:
+            result.reject(line, f"invalid amount {row[amount_column]!r}")
+            continue
+        if signed:
+            if amount > 0:
+                result.credits += 1
+                continue
+            amount = -amount
+        elif amount < 0:
+            result.reject(line, f"negative amount {row[amount_column]!r}")
+            continue
+        try:
+            date_str = normalize_date(row[date_column])
+        except ValueError as e:
+            result.reject(line, f"{e}: {row[date_column]!r}")
+            continue
+        category = None
+        if category_column is not None and row[category_column].strip():
+            category = rules.known(row[category_column])
+        if category is None:
+            category = rules.categorize(name)
+        if category is None:
+            result.reject(line, f"no category rule matches {name!r}")
+            continue
+        yield Expense(name, round(amount, 2), category, date_str)
+
+
+def expense_key(expense):
+    """Return the (date, name, amount) key used to spot duplicate expenses."""
+    return expense.date.toordinal(), expense.name.strip().casefold(), to_cents(expense.amount)
+
+
+def skip_duplicates(expenses, existing, result):
+    """Yield the expenses that are not already in the ledger.
+
+    Args:
+        existing (Counter): expense_key -> number of such expenses in the ledger.
+
+    A statement can hold identical expenses (two coffees on the same day), so
+    the n-th occurrence of a key in the file is only a duplicate if the ledger
+    has at least n of them. Occurrences are only counted for keys the ledger
+    has, which keeps the counts bounded by the ledger, not the file.
+    """
+    seen = Counter()
+    for expense in expenses:
+        key = expense_key(expense)
+        if key in existing:
+            seen[key] += 1
+            if seen[key] <= existing[key]:
+                result.duplicates += 1
+                continue
+        yield expense
+
+
+def count_archived(expenses, tracker, existing):
+    """Yield expenses, first adding the archived expenses of each one's month to existing.
+
+    The ledger only holds the months not archived yet. The first expense of
+    an archived month reads that month's worksheet, so importing an old
+    statement again still finds its duplicates. Raises ArchiveUnavailable if
+    the month can't be read.
+    """
+    counted = set()
+    for expense in expenses:
+        month = (expense.date.year, expense.date.month)
+        if month not in counted:
+            counted.add(month)
+            if month in tracker.archive:
+                archived = tracker.load_archived_months([month])
+                if month not in tracker.archived_expenses:
+                    raise ArchiveUnavailable(f"could not read archived month {month[1]:02d}-{month[0]} "
+                                     f"to check for duplicates")
+                existing.update(expense_key(expense) for expense in archived)
+        yield expense
+
+
+def chunked(iterable, size):
+    """Yield lists of up to size items."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_expenses(tracker, csv_file, rules, signed=False, dry_run=False, chunk_rows=CHUNK_ROWS):
+    """Import the expenses of an open CSV file into the tracker.
+
+    Expenses already in the ledger or in an archived month are skipped.
+    Each chunk of new expenses is added to the ledger and the local store in
+    one transaction, then appended to the expenses worksheet in one write. If
+    a write fails, the remaining chunks are still imported locally and every
+    unsaved expense is written by the next save. If an archived month can't
+    be read, the import stops there: the chunks before it stay imported and
+    result.stopped says why.
+
+    Args:
+        tracker (ExpenseTracker): tracker to add the expenses to.
+        csv_file: file opened with newline=''.
+        rules (CategoryRules): maps descriptions to categories.
+        signed (bool): see parse_rows.
+        dry_run (bool): only validate and count the rows.
+
+    Returns:
+        ImportResult: counts of imported, duplicate and rejected rows.
+    """
+    result = ImportResult()
+    with tracker.lock:
+        existing = Counter(expense_key(expense) for expense in tracker.expenses)
+    with metrics.timed("import", "csv") as span:
+        reader, decimal_comma = open_statement(csv_file)
+        expenses = count_archived(parse_rows(reader, rules, result, signed, decimal_comma), tracker, existing)
+        try:
+            for chunk in chunked(skip_duplicates(expenses, existing, result), chunk_rows):
+                result.imported += len(chunk)
+                span.rows += len(chunk)
+                if dry_run:
+                    continue
+                tracker.add_expenses(chunk)
+                if tracker.spreadsheet is None or result.upload_failed:
+                    continue
+                try:
+                    tracker.push_pending_changes()
+                except Exception as e:
+                    tracker.logger.error(f"Error appending imported expenses to Google Sheets: {e}")
+                    result.upload_failed = True
+        except ArchiveUnavailable as e:
+            tracker.logger.error(f"Import stopped: {e}")
+            result.stopped = str(e)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", help="CSV file with a header row naming the description, amount and date columns")
+    parser.add_argument("--rules", help=f"CSV of pattern,category rules (default: {RULES_FILE} if it exists)")
+    parser.add_argument("--default-category", help="category of rows no rule matches; they are rejected otherwise")
+    parser.add_argument("--signed", action="store_true",
+                        help="negative amounts are expenses and positive ones are skipped, as on bank statements")
+    parser.add_argument("--dry-run", action="store_true", help="check the file without importing anything")
+    args = parser.parse_args(argv)
+
+    setup_logging()
+    rules_path = args.rules or (RULES_FILE if os.path.exists(RULES_FILE) else None)
+    tracker = ExpenseTracker(get_spreadsheet, LocalStore())
+    try:
+        rules = CategoryRules(load_rules(rules_path) if rules_path else [], tracker.expense_categories,
+                              args.default_category)
+        with open(args.file, newline='', encoding='utf-8-sig') as csv_file:
+            result = import_expenses(tracker, csv_file, rules, args.signed, args.dry_run)
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Import failed: {e}")
+        return 1
+    print(("Checked" if args.dry_run else "Imported") + f" {args.file}: {result}.")
+    for line, reason in result.errors:
+        print(f"  line {line}: {reason}")
+    if result.rejected > len(result.errors):
+        print(f"  ... and {result.rejected - len(result.errors)} more (see the log)")
+    if result.upload_failed:
+        print("Failed to save expenses to Google Sheets. They are kept locally and written by the next save.")
+    if result.stopped:
+        print(f"Import stopped before the end of the file: {result.stopped}. The expenses counted above were "
+              f"imported; importing the file again skips them.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
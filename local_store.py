@@ -0,0 +1,213 @@
+import json
+import sqlite3
+import threading
+
+# Default location of the local cache, next to expense_tracker.log
+STORE_PATH = 'expense_tracker.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    amount REAL NOT NULL,
+    category TEXT NOT NULL,
+    date TEXT NOT NULL,
+    sheet_row INTEGER,
+    synced TEXT,
+    dirty INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS deleted_rows (
+    sheet_row INTEGER PRIMARY KEY,
+    synced TEXT
+);
+CREATE TABLE IF NOT EXISTS categories (
+    position INTEGER PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class LocalStore:
+    """SQLite cache holding expenses, categories, the budget and sync state.
+
+    Expenses keep their Google Sheets row number, the fingerprint of the row as
+    last seen on the sheet and a dirty flag, so changes made while offline can
+    be pushed to the sheet later.
+    """
+    def __init__(self, path=STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        # Shared between the menu and the background sync thread
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def close(self):
+        """Close the database connection."""
+        with self.lock:
+            self.connection.close()
+
+    def get_setting(self, key, default=None):
+        """Return a JSON-decoded setting, or default if it is not set."""
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_setting(self, key, value):
+        """Store a JSON-encodable setting."""
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, json.dumps(value))
+            )
+
+    def has_data(self):
+        """Return True once the store has been seeded from Google Sheets."""
+        return self.get_setting('seeded', False)
+
+    def load_expenses(self):
+        """Return all expense rows in sheet order, expenses not yet on the sheet last.
+
+        Returns:
+            list: (id, name, amount, category, date, sheet_row, synced, dirty) tuples.
+        """
+        with self.lock:
+            return self.connection.execute(
+                "SELECT id, name, amount, category, date, sheet_row, synced, dirty FROM expenses "
+                "ORDER BY sheet_row IS NULL, sheet_row, id"
+            ).fetchall()
+
+    def load_deleted_rows(self):
+        """Return sheet rows deleted locally but not yet on the sheet."""
+        with self.lock:
+            return dict(self.connection.execute("SELECT sheet_row, synced FROM deleted_rows").fetchall())
+
+    def load_categories(self):
+        """Return the list of category names."""
+        with self.lock:
+            return [name for (name,) in self.connection.execute("SELECT name FROM categories ORDER BY position")]
+
+    def save_expense(self, expense, dirty=False):
+        """Insert or update a single expense, assigning expense.id on insert."""
+        values = (expense.name, expense.amount, expense.category, expense.date_str(),
+                  expense.row, expense.synced, int(dirty))
+        with self.lock, self.connection:
+            if expense.id is None:
+                cursor = self.connection.execute(
+                    "INSERT INTO expenses (name, amount, category, date, sheet_row, synced, dirty) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)", values
+                )
+                expense.id = cursor.lastrowid
+            else:
+                self.connection.execute(
+                    "UPDATE expenses SET name = ?, amount = ?, category = ?, date = ?, "
+                    "sheet_row = ?, synced = ?, dirty = ? WHERE id = ?", values + (expense.id,)
+                )
+
+    def insert_expenses(self, expenses):
+        """Insert new expenses in one transaction, assigning their ids."""
+        with self.lock, self.connection:
+            for expense in expenses:
+                cursor = self.connection.execute(
+                    "INSERT INTO expenses (name, amount, category, date, sheet_row, synced, dirty) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (expense.name, expense.amount, expense.category, expense.date_str(),
+                     expense.row, expense.synced)
+                )
+                expense.id = cursor.lastrowid
+
+    def update_expenses(self, expenses, dirty_expenses):
+        """Update several stored expenses in one transaction."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE expenses SET name = ?, amount = ?, category = ?, date = ?, "
+                "sheet_row = ?, synced = ?, dirty = ? WHERE id = ?",
+                [(expense.name, expense.amount, expense.category, expense.date_str(),
+                  expense.row, expense.synced, int(expense in dirty_expenses), expense.id)
+                 for expense in expenses]
+            )
+
+    def delete_expense(self, expense):
+        """Delete an expense, remembering its sheet row until it is synced."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM expenses WHERE id = ?", (expense.id,))
+            if expense.row is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO deleted_rows (sheet_row, synced) VALUES (?, ?)",
+                    (expense.row, expense.synced)
+                )
+
+    def save_categories(self, categories):
+        """Replace the stored category list."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM categories")
+            self.connection.executemany(
+                "INSERT INTO categories (position, name) VALUES (?, ?)", enumerate(categories)
+            )
+
+    def save_sync_state(self, expenses, dirty_expenses, deleted_rows):
+        """Record sheet rows, fingerprints and pending changes after a sync."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "UPDATE expenses SET sheet_row = ?, synced = ?, dirty = ? WHERE id = ?",
+                [(expense.row, expense.synced, int(expense in dirty_expenses), expense.id)
+                 for expense in expenses]
+            )
+            self.connection.execute("DELETE FROM deleted_rows")
+            self.connection.executemany(
+                "INSERT INTO deleted_rows (sheet_row, synced) VALUES (?, ?)", deleted_rows.items()
+            )
+
+    def apply_refresh(self, saved, removed, dirty_expenses, deleted_rows):
+        """Record changes pulled from the sheet in one transaction.
+
+        Args:
+            saved (list): expenses added, edited or moved on the sheet.
+            removed (list): expenses whose rows were deleted on the sheet.
+        """
+        with self.lock, self.connection:
+            for expense in saved:
+                values = (expense.name, expense.amount, expense.category, expense.date_str(),
+                          expense.row, expense.synced, int(expense in dirty_expenses))
+                if expense.id is None:
+                    cursor = self.connection.execute(
+                        "INSERT INTO expenses (name, amount, category, date, sheet_row, synced, dirty) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", values
+                    )
+                    expense.id = cursor.lastrowid
+                else:
+                    self.connection.execute(
+                        "UPDATE expenses SET name = ?, amount = ?, category = ?, date = ?, "
+                        "sheet_row = ?, synced = ?, dirty = ? WHERE id = ?", values + (expense.id,)
+                    )
+            self.connection.executemany(
+                "DELETE FROM expenses WHERE id = ?", [(expense.id,) for expense in removed]
+            )
+            self.connection.execute("DELETE FROM deleted_rows")
+            self.connection.executemany(
+                "INSERT INTO deleted_rows (sheet_row, synced) VALUES (?, ?)", deleted_rows.items()
+            )
+
+    def replace_all(self, expenses, categories):
+        """Replace the whole cache with data freshly loaded from Google Sheets."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM expenses")
+            self.connection.execute("DELETE FROM deleted_rows")
+            self.connection.execute("DELETE FROM categories")
+            for expense in expenses:
+                cursor = self.connection.execute(
+                    "INSERT INTO expenses (name, amount, category, date, sheet_row, synced, dirty) "
+                    "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                    (expense.name, expense.amount, expense.category, expense.date_str(),
+                     expense.row, expense.synced)
+                )
+                expense.id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO categories (position, name) VALUES (?, ?)", enumerate(categories)
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('seeded', 'true')"
+            )
@@ -0,0 +1,209 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+SAMPLE_SIZE = 2048  # Most recent observations kept per histogram for the quantiles
+
+logger = logging.getLogger("expense_tracker.metrics")
+
+
+class Histogram:
+    """Count, sum and recent samples of an observed value."""
+    def __init__(self, sample_size=SAMPLE_SIZE):
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+
+    def quantiles(self, quantiles=QUANTILES):
+        """Return {quantile: value} over the recent samples (nearest rank)."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in quantiles}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles}
+
+
+class MetricsRegistry:
+    """Thread-safe in-process store of counters and histograms.
+
+    Metrics are keyed by name and a set of labels, e.g.
+    observe("sheets_call_seconds", 0.2, operation="append_rows").
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def increment(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_dict(self):
+        """Return all metrics as plain data, with p50/p95/p99 for histograms."""
+        with self.lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+            histograms = []
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                quantiles = histogram.quantiles()
+                histograms.append({
+                    "name": name,
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    **{f"p{round(q * 100)}": value for q, value in quantiles.items()},
+                })
+        return {"counters": counters, "histograms": histograms}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        def labels_text(labels, **extra):
+            pairs = list(labels) + list(extra.items())
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+        lines = []
+        with self.lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{labels_text(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in typed:
+                    lines.append(f"# TYPE {name} summary")
+                    typed.add(name)
+                for q, value in histogram.quantiles().items():
+                    lines.append(f"{name}{labels_text(labels, quantile=q)} {value}")
+                lines.append(f"{name}_sum{labels_text(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{labels_text(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path):
+        """Write the metrics to path: Prometheus text for .prom files, JSON otherwise."""
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        with open(path, "w") as metrics_file:
+            metrics_file.write(text)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Span:
+    """One timed operation and the rows, bytes and retries it accounted for."""
+    __slots__ = ('operation', 'rows', 'bytes', 'requests', 'retries', 'paused')
+
+    def __init__(self, operation, rows=0):
+        self.operation = operation
+        self.rows = rows
+        self.bytes = 0
+        self.requests = 0
+        self.retries = 0
+        self.paused = 0.0
+
+
+_local = threading.local()
+
+
+def _spans():
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        spans = _local.spans = []
+    return spans
+
+
+@contextmanager
+def timed(metric, operation, rows=0, registry=REGISTRY):
+    """Time a block as operation and record it under metric.
+
+    Records the latency in the {metric}_seconds histogram and the rows,
+    bytes, HTTP requests and retries of the block in {metric}_*_total
+    counters, then logs the whole span as one JSON line. Spans nest: HTTP
+    traffic reported by record_request counts towards every open span of the
+    thread. The yielded Span's rows can be set once they are known.
+    """
+    span = Span(operation, rows)
+    spans = _spans()
+    spans.append(span)
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield span
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started - span.paused
+        spans.pop()
+        registry.observe(f"{metric}_seconds", elapsed, operation=operation)
+        registry.increment(f"{metric}_total", operation=operation, status=status)
+        for field in ('rows', 'bytes', 'requests', 'retries'):
+            value = getattr(span, field)
+            if value:
+                registry.increment(f"{metric}_{field}_total", value, operation=operation)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({
+                "metric": metric,
+                "operation": operation,
+                "status": status,
+                "latency_ms": round(elapsed * 1000, 3),
+                "rows": span.rows,
+                "bytes": span.bytes,
+                "requests": span.requests,
+                "retries": span.retries,
+            }))
+
+
+def record_request(sent, received, retries):
+    """Add one HTTP request's traffic to the open spans of this thread."""
+    for span in _spans():
+        span.bytes += sent + received
+        span.requests += 1
+        span.retries += retries
+
+
+@contextmanager
+def paused():
+    """Leave the time spent in the block (e.g. waiting for input) out of open spans."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        for span in _spans():
+            span.paused += elapsed
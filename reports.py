@@ -0,0 +1,166 @@
+import calendar
+from datetime import date
+
+import numpy as np
+from tabulate import tabulate
+
+
+class ExpenseColumns:
+    """Column arrays of a ledger, built once per report run.
+
+    Attributes:
+        cents (ndarray): int64 amounts in cents.
+        days (ndarray): int64 proleptic Gregorian ordinals of the dates.
+        months (ndarray): int64 month numbers (year * 12 + month - 1).
+        category_codes (ndarray): int64 index into categories for each row.
+        categories (list): category names, indexed by category code.
+        names (list): expense names, in row order.
+    """
+    def __init__(self, expenses):
+        count = len(expenses)
+        codes = {}
+        self.cents = np.rint(np.fromiter((e.amount for e in expenses), dtype=np.float64, count=count) * 100).astype(np.int64)
+        self.days = np.fromiter((e.date.toordinal() for e in expenses), dtype=np.int64, count=count)
+        self.months = np.fromiter((e.date.year * 12 + e.date.month - 1 for e in expenses), dtype=np.int64, count=count)
+        self.category_codes = np.fromiter(
+            (codes.setdefault(e.category, len(codes)) for e in expenses), dtype=np.int64, count=count
+        )
+        self.categories = list(codes)
+        self.names = [e.name for e in expenses]
+
+    def __len__(self):
+        return len(self.cents)
+
+
+def month_label(month_number):
+    """Format a year * 12 + month - 1 month number as MM-YYYY."""
+    year, month = divmod(int(month_number), 12)
+    return f"{month + 1:02d}-{year}"
+
+
+def month_category_pivot(columns):
+    """Total spend per month and category.
+
+    Returns:
+        tuple: (month numbers, category names, 2-D array of euros indexed
+        [month, category]).
+    """
+    if not len(columns):
+        return np.array([], dtype=np.int64), [], np.zeros((0, 0))
+    month_values, month_index = np.unique(columns.months, return_inverse=True)
+    width = len(columns.categories)
+    cells = np.bincount(
+        month_index * width + columns.category_codes,
+        weights=columns.cents,
+        minlength=len(month_values) * width,
+    )
+    return month_values, columns.categories, cells.reshape(len(month_values), width) / 100
+
+
+def budget_burndown(columns, budget, year, month, until=None):
+    """Daily and month-to-date spend against the monthly budget.
+
+    Args:
+        until (int): last day of the month to report, e.g. today's date for
+            the current month. Defaults to the end of the month.
+
+    Returns:
+        list: [day, spent that day, spent month-to-date, budget remaining] rows.
+    """
+    days_in_month = calendar.monthrange(year, month)[1]
+    until = days_in_month if until is None else min(until, days_in_month)
+    first_day = date(year, month, 1).toordinal()
+    in_month = columns.months == year * 12 + month - 1
+    daily = np.bincount(
+        columns.days[in_month] - first_day,
+        weights=columns.cents[in_month],
+        minlength=days_in_month,
+    )[:until] / 100
+    month_to_date = np.cumsum(daily)
+    remaining = budget - month_to_date
+    return [[day, spent, total, left]
+            for day, spent, total, left in zip(range(1, until + 1), daily, month_to_date, remaining)]
+
+
+def rolling_averages(columns, windows=(3, 6, 12)):
+    """Monthly totals and their trailing averages over each window.
+
+    Months without expenses count as zero. The first months of the ledger
+    average over the months available so far.
+
+    Returns:
+        tuple: (month numbers, monthly totals in euros, {window: averages}).
+    """
+    if not len(columns):
+        return np.array([], dtype=np.int64), np.array([]), {window: np.array([]) for window in windows}
+    first_month = columns.months.min()
+    totals = np.bincount(columns.months - first_month, weights=columns.cents) / 100
+    month_values = np.arange(len(totals)) + first_month
+    running = np.concatenate(([0.0], np.cumsum(totals)))
+    index = np.arange(len(totals))
+    averages = {}
+    for window in windows:
+        start = np.maximum(index - window + 1, 0)
+        averages[window] = (running[index + 1] - running[start]) / (index + 1 - start)
+    return month_values, totals, averages
+
+
+def top_expenses(columns, n=5):
+    """The n largest expenses of each category.
+
+    Returns:
+        list: (category, name, date ordinal, amount in euros) tuples, grouped by
+        category and largest first.
+    """
+    if not len(columns):
+        return []
+    order = np.lexsort((-columns.cents, columns.category_codes))
+    codes = columns.category_codes[order]
+    # Position of each row within its category group
+    group_starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    group_sizes = np.diff(np.r_[group_starts, len(codes)])
+    rank = np.arange(len(codes)) - np.repeat(group_starts, group_sizes)
+    selected = order[rank < n]
+    return [(columns.categories[columns.category_codes[i]], columns.names[i],
+             int(columns.days[i]), columns.cents[i] / 100) for i in selected]
+
+
+def print_reports(expenses, budget, month=None, top_n=5):
+    """Print the pivot, burn-down, rolling-average and top-N reports.
+
+    Args:
+        expenses (list): Expense objects.
+        budget (float): monthly budget.
+        month (tuple): (year, month) for the burn-down; defaults to the current month.
+        top_n (int): number of expenses listed per category.
+    """
+    columns = ExpenseColumns(expenses)
+    if not len(columns):
+        print("No expenses found.")
+        return
+
+    month_values, categories, cells = month_category_pivot(columns)
+    table = [[month_label(m)] + [f"€{v:.2f}" for v in row] + [f"€{row.sum():.2f}"]
+             for m, row in zip(month_values, cells)]
+    print("Monthly Spend by Category")
+    print(tabulate(table, ["Month"] + categories + ["Total"], tablefmt="pretty"))
+
+    today = date.today()
+    year, month_number = month if month is not None else (today.year, today.month)
+    until = today.day if (year, month_number) == (today.year, today.month) else None
+    table = [[f"{day:02d}-{month_number:02d}-{year}", f"€{spent:.2f}", f"€{total:.2f}", f"€{left:.2f}"]
+             for day, spent, total, left in budget_burndown(columns, budget, year, month_number, until)]
+    print(f"Budget Burn-down for {month_number:02d}-{year} (budget €{budget:.2f})")
+    print(tabulate(table, ["Date", "Spent", "Month to Date", "Remaining"], tablefmt="pretty"))
+
+    windows = (3, 6, 12)
+    month_values, totals, averages = rolling_averages(columns, windows)
+    table = [[month_label(m), f"€{total:.2f}"] + [f"€{averages[w][i]:.2f}" for w in windows]
+             for i, (m, total) in enumerate(zip(month_values, totals))]
+    print("Rolling Monthly Averages")
+    print(tabulate(table, ["Month", "Total"] + [f"{w}-Month Avg" for w in windows], tablefmt="pretty"))
+
+    table = [[category, name, date.fromordinal(day).strftime('%d/%m/%Y'), f"€{amount:.2f}"]
+             for category, name, day, amount in top_expenses(columns, top_n)]
+    print(f"Top {top_n} Expenses per Category")
+    print(tabulate(table, ["Category", "Expense Name", "Date", "Amount"], tablefmt="pretty"))
@@ -1,9 +1,23 @@
 import logging
-import gspread
-from google.oauth2.service_account import Credentials
-from tabulate import tabulate
-from datetime import datetime
+import math
+import os
+import re
+import sys
+import threading
+from functools import lru_cache
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 import warnings
+from local_store import LocalStore
+from aggregates import ExpenseAggregates
+from archive import MANIFEST_SHEET, ArchiveManifest, shard_title
+from categories import CategoryRegistry
+from expense_index import ExpenseIndex
+from write_behind import WriteBehindQueue
+import metrics
+# gspread, google-auth, tabulate and numpy are imported on first use so that
+# importing this module stays cheap and does no network I/O
 
 # Suppress UserWarning from gspread
 warnings.filterwarnings("ignore", category=UserWarning, module="gspread")
@@ -16,61 +30,332 @@ SCOPE = [
     "https://www.googleapis.com/auth/drive"
 ] 
 
-# Load Google Sheets credentials from the JSON file
-CREDS = Credentials.from_service_account_file("creds.json")
-SCOPED_CREDS = CREDS.with_scopes(SCOPE)
-GSPREAD_CLIENT = gspread.authorize(SCOPED_CREDS)
+CREDS_FILE = "creds.json"
 SHEET_URL = 'https://docs.google.com/spreadsheets/d/1TR5G47Vod-z4LYL8L5ptrYjAFKCOhmeneQodZjO19qE'
-SHEET = GSPREAD_CLIENT.open_by_url(SHEET_URL)
+
+# Worksheet titles and the header row expected in each of them
+EXPENSES_SHEET = 'expenses'
+CATEGORIES_SHEET = 'categories'
+EXPENSE_HEADERS = ["Expense Name", "Amount", "Category", "Date"]
+CATEGORY_HEADERS = ["Category"]
+DATE_FORMAT = "%d-%m-%Y"
+PLACEHOLDER_DATE = "01-01-2000"  # Used for legacy rows without a date
+SYNC_INTERVAL = 30  # Seconds between retries of failed background writes
+PAGE_SIZE = 50  # Expenses shown per page
+REFRESH_INTERVAL = 60  # Seconds between checks for changes made on the sheet by others
+HOT_MONTHS = 2  # Months kept in the expenses worksheet (the current one included); older ones are archived
+LOGGER_NAME = 'expense_tracker'
+LOG_FILE = 'expense_tracker.log'
+# Amounts are read as numbers whatever the sheet's locale formats them as;
+# dates stay the DD-MM-YYYY text they were written as
+READ_PARAMS = {"valueRenderOption": "UNFORMATTED_VALUE", "dateTimeRenderOption": "FORMATTED_STRING"}
+METRICS_FILE_VARIABLE = 'EXPENSE_TRACKER_METRICS'  # Path the metrics are written to on exit
+# Metric operation names of the menu options
+MENU_ACTIONS = {
+    "1": "add_expense",
+    "2": "display_expenses",
+    "3": "edit_or_remove_expense",
+    "4": "adjust_budget",
+    "5": "manage_categories",
+    "6": "summarize_expenses",
+    "7": "reports",
+    "8": "refresh",
+    "9": "exit",
+}
+
+_client_lock = threading.Lock()
+_logging_lock = threading.Lock()
+_log_listener = None
+
+
+def setup_logging(log_file=LOG_FILE):
+    """Return the application logger, writing to log_file from a background thread.
+
+    Records are handed to a QueueHandler and written by a QueueListener, so
+    logging never waits on the disk. The handlers are only added once however
+    often this is called.
+    """
+    global _log_listener
+    logger = logging.getLogger(LOGGER_NAME)
+    with _logging_lock:
+        if _log_listener is None:
+            import atexit
+            import queue
+            from logging.handlers import QueueHandler, QueueListener
+
+            log_queue = queue.SimpleQueue()
+            file_handler = logging.FileHandler(log_file)
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s'))
+            _log_listener = QueueListener(log_queue, file_handler)
+            _log_listener.start()
+            # Flush what is still queued when the interpreter exits
+            atexit.register(_log_listener.stop)
+            logger.setLevel(logging.DEBUG)
+            logger.addHandler(QueueHandler(log_queue))
+            # Kept out of the console: metrics are logged for every Sheets call
+            logger.propagate = False
+    return logger
+
+
+def prompt(text):
+    """input() whose waiting time is left out of the menu action timings."""
+    with metrics.paused():
+        return input(text)
+
+
+@lru_cache(maxsize=None)
+def _authorize(creds_file):
+    import gspread
+    from google.oauth2.service_account import Credentials
+    from sheets_client import RateLimitedClient
+
+    creds = Credentials.from_service_account_file(creds_file).with_scopes(SCOPE)
+    # Throttled, retrying client sharing one pooled HTTP session
+    return gspread.authorize(creds, client_factory=RateLimitedClient)
+
+
+@lru_cache(maxsize=None)
+def _open_sheet(sheet_url, creds_file):
+    return _authorize(creds_file).open_by_url(sheet_url)
+
+
+def get_client(creds_file=CREDS_FILE):
+    """Return the authorised gspread client, created on the first call."""
+    with _client_lock:
+        return _authorize(creds_file)
+
+
+def get_spreadsheet(sheet_url=SHEET_URL, creds_file=CREDS_FILE):
+    """Return the expense tracker spreadsheet, opened on the first call."""
+    with _client_lock:
+        return _open_sheet(sheet_url, creds_file)
+
+
+@lru_cache(maxsize=8192)
+def parse_date(date_str):
+    """Parse a DD-MM-YYYY date; cached because ledgers repeat the same dates."""
+    return datetime.strptime(date_str, DATE_FORMAT)
+
 
 class Expense:
     """Expense entry."""
+    # No per-instance __dict__: large ledgers keep one of these per row
+    __slots__ = ('name', 'amount', 'category', 'category_id', 'date', 'row', 'synced', 'id')
+
     def __init__(self, name, amount, category, date_str):
-        self.name = name
+        # Unformatted sheet cells holding numbers arrive as int or float
+        self.name = name if isinstance(name, str) else str(name)
         self.amount = amount
-        self.category = category
+        # Category names repeat on every row; share one string per name
+        self.category = sys.intern(category if isinstance(category, str) else str(category))
+        self.category_id = None  # Id in the tracker's CategoryRegistry, set when tracked
         self.date = self.validate_date(date_str)
+        self.row = None  # Row number in the expenses worksheet, None until saved
+        self.synced = None  # Fingerprint of the row as last seen on the sheet
+        self.id = None  # Primary key in the local store
     
     @staticmethod
     def validate_date(date_str):
         """Validates and converts the date string to a datetime object."""
         try:
-            return datetime.strptime(date_str, "%d-%m-%Y")
+            return parse_date(date_str)
         except ValueError:
             raise ValueError("Date must be in DD-MM-YYYY format")
     
     def __str__(self):
         return f"{self.date.strftime('%Y-%m-%d')} - {self.name} - {self.category} - €{self.amount:.2f}"
 
+    def date_str(self):
+        """Return the date in the DD-MM-YYYY format used on the sheet."""
+        return self.date.strftime(DATE_FORMAT)
+
+    def to_row(self):
+        """Return the expense as a worksheet row in EXPENSE_HEADERS order."""
+        return [self.name, self.amount, self.category, self.date_str()]
+
+    def fingerprint(self):
+        """Return the fingerprint of the row this expense writes to the sheet."""
+        return self.fingerprint_of(self.to_row())
+
+    @staticmethod
+    def fingerprint_of(values):
+        """Normalise worksheet row values (EXPENSE_HEADERS order) for comparison."""
+        # Runs for every row of a refresh; unformatted amounts arrive as numbers
+        values = [value if isinstance(value, str) else str(value) for value in values[:len(EXPENSE_HEADERS)]]
+        values += [""] * (len(EXPENSE_HEADERS) - len(values))
+        parsed_amount = ExpenseTracker.parse_amount(values[1])
+        if parsed_amount is not None:
+            values[1] = f"{parsed_amount:.2f}"
+        return "\x1f".join(values)
+
+
+def row_runs(rows):
+    """Group sorted row numbers into [first, last] runs of adjacent rows."""
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
+
+class PendingChanges:
+    """Snapshot of local changes taken for one sync with Google Sheets."""
+    def __init__(self):
+        self.rewrite = None  # [(expense, values)] when the whole sheet is rewritten
+        self.deleted = {}  # Sheet row -> fingerprint of the removed row
+        self.updates = []  # [(expense, row, values, fingerprint before the edit)]
+        self.appends = []  # [(expense, values)]
+        self.categories = None  # Category list to write, if it changed
+        self.category_rows = 0
+        self.archive_updates = []  # [((worksheet title, row), values)] of archived rows to rewrite
+        self.manifest = None  # Archive manifest rows to write, if it changed
+        self.conflicts = []
+        self.rejected = []  # Expenses whose edit was dropped because of a conflict
+        # Progress of push_changes, used to apply partial results
+        self.rewrite_done = False
+        self.deleted_done = []
+        self.updates_done = False
+        self.first_appended_row = None
+        self.categories_done = False
+        self.archive_done = False
+
+    def empty(self):
+        return (self.rewrite is None and not self.deleted and not self.updates
+                and not self.appends and self.categories is None
+                and not self.archive_updates and self.manifest is None)
+
+    def shift(self, row):
+        """Return where a row ended up after the deletions made by this sync."""
+        return row - bisect_left(self.deleted_done, row)
+
+
+class RefreshResult:
+    """What a refresh from the sheet changed in the local ledger."""
+    def __init__(self):
+        self.added = []  # Expenses added on the sheet
+        self.updated = []  # Expenses edited on the sheet
+        self.moved = []  # Expenses whose row number changed
+        self.removed = []  # Expenses whose rows were deleted on the sheet
+        self.categories_changed = False
+        self.archived = []  # Months newly archived by another client
+
+    def changed(self):
+        return bool(self.added or self.updated or self.removed or self.categories_changed or self.archived)
+
+    def __str__(self):
+        return (f"{len(self.added)} added, {len(self.updated)} updated, {len(self.removed)} removed"
+                + (", categories updated" if self.categories_changed else "")
+                + (f", {len(self.archived)} months archived" if self.archived else ""))
+
 
 class ExpenseTracker:
-    """Manages the expense tracking application."""
-    def __init__(self, spreadsheet):
-        self.expense_sheet = spreadsheet.worksheet('expenses')
-        self.categories_sheet = spreadsheet.worksheet('categories')
-        self.expenses = []
-        self.expense_categories = self.load_categories()
-        self.user_budget = self.get_user_budget()
+    """Manages the expense tracking application.
+
+    Args:
+        spreadsheet: gspread Spreadsheet, a function returning one (opened on
+            first use, e.g. get_spreadsheet), or None to work offline from
+            the store's cached data, or from an empty ledger without any.
+        store (LocalStore): local cache; with cached data the tracker starts
+            without contacting Google Sheets.
+        budget (float): monthly budget; defaults to the stored one. Left as None
+            when neither is set, and main() asks for it.
+    """
+    def __init__(self, spreadsheet, store=None, budget=None):
         self.setup_logger()
+        self._spreadsheet = spreadsheet
+        self.spreadsheet_lock = threading.Lock()
+        self.store = store
+        self.expense_sheet = None
+        self.categories_sheet = None
+        self.sheet_ids = {}  # Worksheet title -> sheet id, for every worksheet
+        # Pending changes written by the next save_expenses
+        self.dirty_expenses = set()
+        self.deleted_rows = {}  # Sheet row -> fingerprint of the removed row
+        self.unsaved_expenses = []  # New expenses not yet appended to the sheet
+        self.expense_layout_ok = False
+        # Why the expenses worksheet must not be written, if it could not be
+        # fully loaded: a rewrite from the ledger would delete its rows
+        self.sheet_problem = None
+        self.saved_categories = []  # Categories as last written to the sheet
+        self.category_rows = 0  # Rows used below the categories header
+        # The lock guards the expense list and pending changes; sync_lock
+        # makes sure only one sync talks to the sheet at a time
+        self.lock = threading.RLock()
+        self.sync_lock = threading.Lock()
+        self.sync_conflicts = []
+        self.remote_modified = None  # Sheet modification time seen by the last refresh
+        self.rejected_edits = set()  # Expenses whose edit lost a conflict; reset by the next refresh
+        self.refresh_results = []  # Background refreshes not yet reported
+        self.refresh_stop = threading.Event()
+        self.refresh_thread = None
+        self.archive = ArchiveManifest()  # Closed months moved to their own worksheets
+        self.archived_expenses = {}  # (year, month) -> expenses of an archived month, once loaded
+        self.archive_updates = {}  # (worksheet title, row) -> values of an archived row to rewrite
+        self.write_queue = WriteBehindQueue(
+            lambda mutations: self.push_pending_changes(),
+            has_pending=self.has_pending_changes,
+            retry_interval=SYNC_INTERVAL,
+        )
+
+        if store is not None and store.has_data():
+            self.load_from_store()
+        elif spreadsheet is None:
+            # Offline with nothing cached: an empty ledger. The store is not
+            # marked as seeded, so it is filled from the sheet once online
+            self.expenses = []
+            self.expense_categories = CategoryRegistry()
+        else:
+            self.load_from_sheets()
+            # Not seeded from a sheet that was not fully loaded: the next
+            # start reads it again
+            if store is not None and self.sheet_problem is None:
+                store.replace_all(self.expenses, self.expense_categories)
+                self.save_sheet_state()
+                self.save_archive_state()
+
+        for expense in self.expenses:
+            self.expense_categories.bind(expense)
+        self.aggregates = ExpenseAggregates(self.expenses)
+        self.expense_index = ExpenseIndex(self.expenses)
+
+        if budget is None and store is not None:
+            budget = store.get_setting('budget')
+        self.user_budget = None
+        if budget is not None:
+            self.set_user_budget(budget)
+
+    @property
+    def spreadsheet(self):
+        """The Google Sheets spreadsheet, opened on first use."""
+        with self.spreadsheet_lock:
+            if callable(self._spreadsheet):
+                self._spreadsheet = self._spreadsheet()
+            return self._spreadsheet
+
+    @spreadsheet.setter
+    def spreadsheet(self, spreadsheet):
+        with self.spreadsheet_lock:
+            self._spreadsheet = spreadsheet
 
     def setup_logger(self):
             """Set up a logger for the application."""
-            self.logger = logging.getLogger(__name__)
-            self.logger.setLevel(logging.DEBUG)
-            formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-            file_handler = logging.FileHandler('expense_tracker.log')
-            file_handler.setFormatter(formatter)
-            self.logger.addHandler(file_handler)
+            self.logger = setup_logging()
 
     def set_user_budget(self, budget):
             """Set the user's monthly budget."""
             self.user_budget = budget
+            if self.store is not None:
+                self.store.set_setting('budget', budget)
 
     def get_user_budget(self):
         """Prompt user for their monthly budget."""
         while True:
             try:
-                budget = float(input("Enter your monthly budget: "))
+                budget = self.parse_amount(prompt("Enter your monthly budget: "))
+                if budget is None:
+                    raise ValueError("Budget must be a number.")
                 if budget < 0:
                     raise ValueError("Budget cannot be negative.")
                 return budget
@@ -86,58 +371,139 @@ class ExpenseTracker:
             }
             return f"{colors[color]}{text}{colors['white']}"
 
-    def load_data(self, sheet, column_name):
-            """Load data from specific column in Google Sheets worksheet."""
+    def open_worksheets(self, reload=False):
+            """Look up the worksheets with one metadata request.
+
+            Args:
+                reload (bool): list them again, e.g. to find worksheets added by others.
+            """
+            if self.expense_sheet is not None and not reload:
+                return
+            with metrics.timed("sheets_call", "worksheets"):
+                worksheets = {worksheet.title: worksheet for worksheet in self.spreadsheet.worksheets()}
+            self.expense_sheet = worksheets[EXPENSES_SHEET]
+            self.categories_sheet = worksheets[CATEGORIES_SHEET]
+            self.sheet_ids = {title: worksheet.id for title, worksheet in worksheets.items()}
+
+    def load_from_sheets(self):
+            """Load expenses, categories and the archive manifest from Google Sheets.
+
+            Archived months stay in their own worksheets until they are needed.
+            """
+            self.open_worksheets()
+            titles = [EXPENSES_SHEET, CATEGORIES_SHEET]
+            if MANIFEST_SHEET in self.sheet_ids:
+                titles.append(MANIFEST_SHEET)
+            # All worksheets are fetched in a single round-trip
+            sheet_values = self.fetch_sheet_values(*titles)
+            self.expenses = self.load_expenses(sheet_values[EXPENSES_SHEET])
+            self.expense_categories = CategoryRegistry(self.load_categories(sheet_values[CATEGORIES_SHEET]))
+            self.archive = ArchiveManifest.from_rows(sheet_values.get(MANIFEST_SHEET, []))
+
+    def load_from_store(self):
+            """Load expenses, categories and pending sync state from the local store."""
+            self.expenses = []
+            for expense_id, name, amount, category, date_str, row, synced, dirty in self.store.load_expenses():
+                expense = Expense(name, amount, category, date_str)
+                expense.id = expense_id
+                expense.row = row
+                expense.synced = synced
+                if dirty:
+                    self.dirty_expenses.add(expense)
+                if row is None:
+                    self.unsaved_expenses.append(expense)
+                self.expenses.append(expense)
+            self.deleted_rows = self.store.load_deleted_rows()
+            self.expense_categories = CategoryRegistry(self.store.load_categories())
+            self.saved_categories = self.store.get_setting('saved_categories', [])
+            self.category_rows = self.store.get_setting('category_rows', 0)
+            self.expense_layout_ok = self.store.get_setting('expense_layout_ok', False)
+            self.remote_modified = self.store.get_setting('remote_modified')
+            self.archive = ArchiveManifest.from_rows(self.store.get_setting('archive_manifest', []))
+            self.archive.dirty = self.store.get_setting('archive_manifest_dirty', False)
+            self.archive_updates = {(title, row): values for title, row, values
+                                    in self.store.get_setting('archive_updates', [])}
+
+    def save_sheet_state(self, expenses=None):
+            """Record in the local store what is currently on the sheet.
+
+            Args:
+                expenses (list): expenses whose sheet row or fingerprint changed;
+                    all expenses by default.
+            """
+            if expenses is None:
+                expenses = self.expenses
+            self.store.save_sync_state(expenses, self.dirty_expenses, self.deleted_rows)
+            self.store.set_setting('saved_categories', self.saved_categories)
+            self.store.set_setting('category_rows', self.category_rows)
+            self.store.set_setting('expense_layout_ok', self.expense_layout_ok)
+            self.store.set_setting('remote_modified', self.remote_modified)
+
+    def save_archive_state(self):
+            """Record the archive manifest in the local store."""
+            if self.store is None:
+                return
+            self.store.set_setting('archive_manifest', self.archive.to_rows())
+            self.store.set_setting('archive_manifest_dirty', self.archive.dirty)
+            self.store.set_setting('archive_updates', [[title, row, values] for (title, row), values
+                                                       in self.archive_updates.items()])
+
+    def fetch_sheet_values(self, *titles):
+            """Fetch all values of the given worksheets in one batched request.
+
+            Returns:
+                dict: worksheet title -> list of rows (header row included).
+            """
+            values = {title: [] for title in titles}
             try:
-                # Find the cell with the specified header name
-                header_cell = sheet.find(column_name)
-                if header_cell:
-                    # Make sure the found cell is in the first row
-                    if header_cell.row == 1:
-                        # Get all values in the column
-                        column_data = sheet.col_values(header_cell.col)
-                        # Remove the header
-                        column_data.pop(0)
-                        return column_data
-                    else:
-                        self.logger.error(f"Header '{column_name}' found but not in the first row.")
-                        return []
-                else:
-                    self.logger.error(f"Header '{column_name}' not found in the sheet.")
-                    return []
+                ranges = [f"'{title}'" for title in titles]
+                with metrics.timed("sheets_call", "values_batch_get") as span:
+                    response = self.spreadsheet.values_batch_get(ranges, params=READ_PARAMS)
+                    for title, value_range in zip(titles, response.get('valueRanges', [])):
+                        values[title] = value_range.get('values', [])
+                    span.rows = sum(len(rows) for rows in values.values())
             except Exception as e:
+                # Don't carry on as if the sheet were empty: the next sync
+                # would overwrite it
                 self.logger.error(f"Error loading data from Google Sheets: {e}")
-                return []
+                raise
+            return values
 
-    def save_data(self, sheet, data, range_name):                
-            try:
-                sheet = self.categories_sheet
-                column = 'A'  # Assuming 'Category' data is in the first column
-                # Directly using 1 for the column index as 'A' corresponds to the first column
-                col_index = 1
-
-                # Clear existing content in the column after the header.
-                sheet.batch_clear([f"{column}2:{column}{len(data)+100}"])  # Adjust as needed
+    def map_columns(self, header_row, column_names):
+            """Map each expected header name to its column index in header_row."""
+            columns = {}
+            for column_name in column_names:
+                if column_name in header_row:
+                    columns[column_name] = header_row.index(column_name)
+                else:
+                    self.logger.error(f"Header '{column_name}' not found in the sheet.")
+            return columns
 
-                # Update the sheet with new data.
-                for i, value in enumerate(data, start=2):  # Starting from row 2 to keep the header
-                    sheet.update_cell(i, col_index, value)
+    def column_values(self, data, range_name, previous_rows=0):
+            """Return a single-column list as worksheet rows under its header.
 
-                self.logger.info("Categories updated successfully.")
-            except Exception as e:
-                self.logger.error(f"Error saving data to Google Sheets: {e}")
-                
+            The list is padded with blanks up to previous_rows so rows of removed
+            items are cleared by the same write.
+            """
+            data = list(data)
+            padding = [""] * (previous_rows - len(data))
+            return [[range_name]] + [[value] for value in data + padding]
 
-    def summarize_expenses(self):
-            """Summarize user's expenses and display the summary."""
-            category_totals = {}
-            total_expenses = 0
+    def summarize_expenses(self, month=None):
+            """Summarize user's expenses for a month and display the summary.
 
-            for expense in self.expenses:
-                total_expenses += expense.amount
-                category_totals[expense.category] = category_totals.get(expense.category, 0) + expense.amount
+            Args:
+                month (tuple): (year, month) to summarize; defaults to the current month.
+            """
+            if month is None:
+                today = datetime.now()
+                month = (today.year, today.month)
+            # Totals come from the aggregate index and the archive manifest,
+            # not a scan of the ledger
+            total_expenses = self.month_total(month)
+            category_totals = self.month_categories(month)
 
-            budget = self.user_budget
+            budget = self.user_budget or 0
 
             if total_expenses < budget:
                 total_expenses_formatted = self.colorize(f'€{total_expenses:.2f}', 'green')
@@ -149,6 +515,7 @@ class ExpenseTracker:
                 total_expenses_formatted = self.colorize(f'€{total_expenses:.2f}', 'white')
                 outstanding_budget = self.colorize(f'€{budget - total_expenses:.2f}', 'white')
 
+            print(f"Summary for {month[1]:02d}-{month[0]}")
             print(f"Total Expenses: {total_expenses_formatted}")
             print(f"Outstanding Monthly Budget: {outstanding_budget}")
             print("Category-wise Expenses:")
@@ -156,59 +523,1134 @@ class ExpenseTracker:
                 formatted_amount = self.colorize(f'€{amount:.2f}', 'green')
                 print(f"{category}: {formatted_amount}")
 
-    def load_expenses(self):
-            """Load expenses data from Google Sheets and convert it to Expense objects.
+    def month_total(self, month):
+            """Return the total in euros for a (year, month), archived expenses included."""
+            return self.aggregates.total_for(month) + self.archive.total_for(month)
+
+    def month_categories(self, month):
+            """Return {category: total in euros} for a (year, month), archived expenses included."""
+            totals = self.archive.categories_for(month)
+            # The ledger's totals are grouped by category id; names are only
+            # looked up for the categories of the month
+            for category_id, amount in self.aggregates.categories_for(month).items():
+                category = self.expense_categories.name_of(category_id)
+                totals[category] = totals.get(category, 0) + amount
+            return totals
+
+    def remaining_budget(self, month):
+            """Return the budget left for a (year, month)."""
+            return (self.user_budget or 0) - self.month_total(month)
+
+    def get_summary_month(self):
+            """Prompt for the month to summarize; Enter selects the current month."""
+            while True:
+                month_str = prompt("Enter month (MM-YYYY, or press Enter for the current month): ")
+                if not month_str:
+                    return None
+                try:
+                    month_date = datetime.strptime(month_str, "%m-%Y")
+                    return (month_date.year, month_date.month)
+                except ValueError:
+                    print("Invalid month format. Please use MM-YYYY.")
+
+    def load_expenses(self, rows=None):
+            """Convert the rows of the expenses worksheet to Expense objects.
+
+            Args:
+                rows (list): worksheet rows including the header. Fetched from
+                    Google Sheets when not given.
 
             Returns:
                 list: list of Expense objects.
             """
             try:
-                expense_data = self.load_data(self.expense_sheet, "Expense Name")
-                amount_data = self.load_data(self.expense_sheet, "Amount")
-                category_data = self.load_data(self.expense_sheet, "Category")
-                
+                if rows is None:
+                    rows = self.fetch_sheet_values(EXPENSES_SHEET)[EXPENSES_SHEET]
+                self.sheet_problem = None
+                if not rows:
+                    return []
+
+                columns = self.map_columns(rows[0], EXPENSE_HEADERS)
+                # Delta writes assume the sheet columns are in EXPENSE_HEADERS order
+                self.expense_layout_ok = rows[0][:len(EXPENSE_HEADERS)] == EXPENSE_HEADERS
+                # Older sheets have no Date column; those rows get the placeholder
+                missing = [header for header in EXPENSE_HEADERS if header != "Date" and header not in columns]
+                if missing:
+                    self.sheet_problem = f"the expenses worksheet has no {', '.join(missing)} column"
+                    return []
+
+                def cell(row, column_name, default=""):
+                    index = columns.get(column_name)
+                    if index is None or index >= len(row):
+                        return default
+                    return row[index]
+
                 expenses = []
-                for name, amount, category in zip(expense_data, amount_data, category_data):
-                    placeholder_date = "01-01-2000"  # Placeholder date
-                    if amount.replace('.', '', 1).isdigit(): # Check if amount is a digit before conversion
-                        expenses.append(Expense(name, float(amount), category, placeholder_date))
+                unread = 0  # Rows that are not blank but hold no valid expense
+                for row_number, row in enumerate(rows[1:], start=2):
+                    amount = self.parse_amount(cell(row, "Amount"))
+                    if amount is None:
+                        unread += any(value != "" for value in row)
+                        continue
+                    date_str = cell(row, "Date") or PLACEHOLDER_DATE
+                    try:
+                        expense = Expense(cell(row, "Expense Name"), amount, cell(row, "Category"), date_str)
+                        expense.row = row_number
+                        expense.synced = Expense.fingerprint_of([cell(row, header) for header in EXPENSE_HEADERS])
+                        expenses.append(expense)
+                    except ValueError as e:
+                        unread += 1
+                        self.logger.error(f"Skipping expense row {row}: {e}")
 
+                # A sheet in another layout is rewritten by the next save, which
+                # is only safe if every row made it into the ledger
+                if unread and not self.expense_layout_ok:
+                    self.sheet_problem = (f"{unread} rows of the expenses worksheet could not be read, and its "
+                                          f"columns are not in the expected order")
                 return expenses
             except Exception as e:
                 self.logger.error(f"Error loading expenses from Google Sheets: {e}")
+                self.sheet_problem = "the expenses worksheet could not be read"
                 return []
 
+    @staticmethod
+    def parse_amount(value):
+            """Convert an amount cell to a float, or None if it is not a finite number.
+
+            Cells are read unformatted, so a comma is never stripped as a
+            thousands separator: in decimal-comma locales it is the decimal point.
+            """
+            try:
+                amount = float(value)  # Numbers and plain numeric text, the common case
+            except (TypeError, ValueError):
+                try:
+                    amount = float(str(value).replace('€', '').strip())
+                except ValueError:
+                    return None
+            # NaN, inf and overflowing values such as 1e400
+            return amount if math.isfinite(amount) else None
+
     def prepare_expense_data_for_sheet(self):
             """Prepare the expense data for Google Sheets."""
-            expense_data = [["Expense Name", "Amount", "Category"]]  
+            expense_data = [EXPENSE_HEADERS]
             for expense in self.expenses:
                 # Append each expense's details as a list
-                expense_data.append([expense.name, expense.amount, expense.category])
+                expense_data.append(expense.to_row())
             return expense_data
 
-    def update_sheet_data(self, data, start_cell='A1'):
-            """Update the Google Sheet with given data starting from the start_cell."""
+    @staticmethod
+    def check_amount(amount):
+            """Raise ValueError unless amount is a finite number.
+
+            Checked before a change touches the ledger: the totals can't hold
+            NaN or infinity, and the sheet would get a row that never loads.
+            """
+            if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+                raise ValueError(f"Amount must be a finite number, not {amount!r}")
+
+    def add_expense(self, expense):
+            """Add a new expense; it is appended to the sheet on the next save. ValueError if its amount is invalid."""
+            self.check_amount(expense.amount)
+            with self.lock:
+                self.expense_categories.bind(expense)
+                self.expenses.append(expense)
+                self.unsaved_expenses.append(expense)
+                self.aggregates.add(expense)
+                self.expense_index.add(expense)
+                if self.store is not None:
+                    self.store.save_expense(expense)
+
+    def add_expenses(self, expenses):
+            """Add several new expenses, stored in one transaction and appended to the sheet on the next save.
+
+            ValueError if an amount is invalid; nothing is added then.
+            """
+            for expense in expenses:
+                self.check_amount(expense.amount)
+            with self.lock:
+                self.expenses.extend(expenses)
+                self.unsaved_expenses.extend(expenses)
+                for expense in expenses:
+                    self.expense_categories.bind(expense)
+                    self.aggregates.add(expense)
+                    self.expense_index.add(expense)
+                if self.store is not None:
+                    self.store.insert_expenses(expenses)
+
+    def mark_expense_dirty(self, expense):
+            """Flag an edited expense so only its row is rewritten on the next save."""
+            with self.lock:
+                if expense.row is not None:
+                    self.dirty_expenses.add(expense)
+                if self.store is not None:
+                    self.store.save_expense(expense, dirty=expense in self.dirty_expenses)
+
+    def update_expense(self, expense, name=None, amount=None, category=None):
+            """Change the given fields of an expense and flag it for saving. ValueError if amount is invalid."""
+            if amount is not None:
+                self.check_amount(amount)
+            with self.lock:
+                self.aggregates.remove(expense)
+                self.expense_index.remove(expense)
+                if name is not None:
+                    expense.name = name
+                if amount is not None:
+                    expense.amount = amount
+                if category is not None:
+                    expense.category = category
+                    self.expense_categories.bind(expense)
+                self.aggregates.add(expense)
+                self.expense_index.add(expense)
+                self.mark_expense_dirty(expense)
+
+    def mark_expenses_dirty(self, expenses):
+            """Flag several edited expenses for saving, stored in one transaction."""
+            with self.lock:
+                self.dirty_expenses.update(expense for expense in expenses if expense.row is not None)
+                if self.store is not None:
+                    self.store.update_expenses(expenses, self.dirty_expenses)
+
+    def load_category_months(self, name):
+            """Load the archived months holding expenses of a category.
+
+            Called before taking the lock: a rename or delete rewrites their rows.
+
+            Returns:
+                list: the (year, month) tuples of those months.
+            """
+            months = self.archive.months_with(name)
+            self.load_archived_months(months)
+            return months
+
+    def require_loaded(self, months):
+            """Raise RuntimeError unless every archived month given is loaded.
+
+            Checked before a category change touches anything, so it is made
+            either in full or not at all.
+            """
+            if any(month not in self.archived_expenses for month in months):
+                raise RuntimeError("Archived months could not be loaded from Google Sheets.")
+
+    def refile_category(self, old_id, new_id, old_name, months):
+            """File every expense of category old_id under new_id; called with the lock held.
+
+            Ledger totals and indexes move in one step each. The rows of the
+            expenses, archived ones included, are rewritten by the next save in
+            a single request together with the category list.
+
+            Args:
+                old_name (str): name the category had, as written on its rows.
+                months (list): archived months holding old_name, from load_category_months.
+            """
+            new_name = self.expense_categories.name_of(new_id)
+            self.require_loaded(months)
+            expenses = self.expense_index.category(old_id)
+            self.aggregates.move_category(old_id, new_id)
+            self.expense_index.move_category(old_id, new_id)
+            for expense in expenses:
+                expense.category_id = new_id
+                expense.category = new_name
+            self.mark_expenses_dirty(expenses)
+            for month in months:
+                title = shard_title(month)
+                for expense in self.archived_expenses[month]:
+                    if expense.category_id == old_id:
+                        expense.category_id = new_id
+                        expense.category = new_name
+                        self.archive_updates[(title, expense.row)] = expense.to_row()
+            self.archive.move_category(old_name, new_name)
+            self.save_archive_state()
+
+    def category_in_use(self, name):
+            """Return True if expenses, archived ones included, are filed under a category."""
+            category_id = self.expense_categories.id_of(name)
+            return bool(self.archive.months_with(name)) or category_id in self.expense_index.categories
+
+    def rename_category(self, index, new_name):
+            """Rename a listed category and the expenses filed under it.
+
+            Raises ValueError if new_name is already listed, and RuntimeError,
+            changing nothing, if archived months holding either name cannot be
+            loaded. Expenses filed under new_name without it being listed join
+            the renamed category.
+            """
+            old_name = self.expense_categories[index]
+            if old_name == new_name:
+                return
+            months = self.load_category_months(old_name)
+            merged_months = self.load_category_months(new_name)
+            with self.lock:
+                self.require_loaded(months + merged_months)
+                category_id = self.expense_categories.id_of(old_name)
+                merged_id = self.expense_categories.id_of(new_name)
+                self.expense_categories.rename(category_id, new_name)
+                # Totals and indexes are keyed by id, so only the rows change
+                self.refile_category(category_id, category_id, old_name, months)
+                if merged_id is not None:
+                    self.refile_category(merged_id, category_id, new_name, merged_months)
+
+    def delete_category(self, index, replacement=None):
+            """Unlist a category, filing its expenses under replacement.
+
+            Raises ValueError if replacement is not another listed category, or
+            if none is given and the category still has expenses.
+            """
+            name = self.expense_categories[index]
+            if replacement is not None and (replacement == name or replacement not in self.expense_categories):
+                raise ValueError(f"Cannot move the expenses of {name} to {replacement}")
+            months = self.load_category_months(name)
+            with self.lock:
+                category_id = self.expense_categories.id_of(name)
+                if replacement is not None:
+                    self.refile_category(category_id, self.expense_categories.id_of(replacement), name, months)
+                elif self.category_in_use(name):
+                    raise ValueError(f"Category {name} still has expenses")
+                self.expense_categories.remove(category_id)
+
+    def remove_expense(self, index):
+            """Remove the expense at index; its sheet row is deleted on the next save."""
+            with self.lock:
+                expense = self.expenses.pop(index)
+                self.aggregates.remove(expense)
+                self.expense_index.remove(expense)
+                self.dirty_expenses.discard(expense)
+                if expense.row is not None:
+                    self.deleted_rows[expense.row] = expense.synced
+                elif expense in self.unsaved_expenses:
+                    self.unsaved_expenses.remove(expense)
+                if self.store is not None:
+                    self.store.delete_expense(expense)
+                return expense
+
+    def take_pending_changes(self, rewrite=False):
+            """Move the pending changes into a PendingChanges snapshot.
+
+            Called with the lock held. From here on, changes made by the menu
+            while the snapshot is being written are recorded as new pending changes.
+            """
+            changes = PendingChanges()
+            if rewrite or not self.expense_layout_ok:
+                changes.rewrite = [(expense, expense.to_row()) for expense in self.expenses]
+                self.dirty_expenses = set()
+                self.deleted_rows = {}
+                self.unsaved_expenses = []
+            else:
+                changes.deleted = self.deleted_rows
+                changes.updates = [(expense, expense.row, expense.to_row(), expense.synced)
+                                   for expense in self.dirty_expenses]
+                changes.appends = [(expense, expense.to_row()) for expense in self.unsaved_expenses]
+                self.deleted_rows = {}
+                self.dirty_expenses = set()
+                self.unsaved_expenses = []
+            if self.expense_categories.names() != self.saved_categories:
+                changes.categories = self.expense_categories.names()
+                changes.category_rows = self.category_rows
+            if self.archive_updates:
+                changes.archive_updates = list(self.archive_updates.items())
+                self.archive_updates = {}
+            if self.archive.dirty:
+                changes.manifest = self.archive.to_rows()
+            return changes
+
+    def changed_rows(self, expected):
+            """Read rows of the expenses worksheet back and return those that changed.
+
+            One request reads every run of adjacent rows.
+
+            Args:
+                expected (dict): sheet row -> fingerprint from the last sync.
+
+            Returns:
+                dict: sheet row -> current values, for the rows, in order, whose
+                fingerprint no longer matches.
+            """
+            if not expected:
+                return {}
+            last_column = chr(ord('A') + len(EXPENSE_HEADERS) - 1)
+            runs = row_runs(sorted(expected))
+            with metrics.timed("sheets_call", "batch_get", rows=len(expected)):
+                remote_runs = self.expense_sheet.batch_get(
+                    [f"A{first}:{last_column}{last}" for first, last in runs],
+                    value_render_option=READ_PARAMS["valueRenderOption"],
+                    date_time_render_option=READ_PARAMS["dateTimeRenderOption"],
+                )
+            changed = {}
+            for (first, last), remote in zip(runs, remote_runs):
+                # Trailing blank rows are left out of the response
+                remote = list(remote) + [[]] * (last - first + 1 - len(remote))
+                for row, remote_values in zip(range(first, last + 1), remote):
+                    if Expense.fingerprint_of(remote_values) != expected[row]:
+                        changed[row] = remote_values
+            return changed
+
+    def detect_conflicts(self, changes):
+            """Drop edits and deletes of rows that were changed on the sheet.
+
+            The rows about to be rewritten or deleted are read back in one request
+            and compared with their fingerprint from the last sync. Conflicting
+            changes are not written and are reported through sync_conflicts.
+            """
+            expected = {row: synced for _, row, _, synced in changes.updates}
+            expected.update(changes.deleted)
+            conflicting = self.changed_rows(expected)
+            for row, remote_values in conflicting.items():
+                changes.conflicts.append((row, remote_values))
+                self.logger.warning(f"Row {row} was changed on the sheet since the last sync; local change not written.")
+            if conflicting:
+                changes.deleted = {row: synced for row, synced in changes.deleted.items() if row not in conflicting}
+                changes.rejected = [update[0] for update in changes.updates if update[1] in conflicting]
+                changes.updates = [update for update in changes.updates if update[1] not in conflicting]
+
+    def push_changes(self, changes):
+            """Write a PendingChanges snapshot to the sheet, recording each completed step.
+
+            Runs without the lock. Errors are raised; the steps completed before
+            the error are still applied by apply_sync_results.
+            """
+            last_column = chr(ord('A') + len(EXPENSE_HEADERS) - 1)
+            if changes.rewrite is not None:
+                expense_data = [EXPENSE_HEADERS] + [values for _, values in changes.rewrite]
+                # Clear rows left over below the rewritten table
+                with metrics.timed("sheets_call", "batch_clear"):
+                    self.expense_sheet.batch_clear([f"A{len(expense_data) + 1}:{last_column}"])
+                # RAW keeps dates as DD-MM-YYYY text instead of letting Sheets
+                # reformat them in the sheet's locale
+                with metrics.timed("sheets_call", "update", rows=len(expense_data)):
+                    self.expense_sheet.update(range_name='A1', values=expense_data, value_input_option='RAW')
+                changes.rewrite_done = True
+            else:
+                self.detect_conflicts(changes)
+                if changes.deleted:
+                    deleted = sorted(changes.deleted)
+                    # Delete bottom-up so earlier deletions don't shift later ones
+                    requests = [{
+                        "deleteDimension": {
+                            "range": {
+                                "sheetId": self.expense_sheet.id,
+                                "dimension": "ROWS",
+                                "startIndex": row - 1,
+                                "endIndex": row,
+                            }
+                        }
+                    } for row in reversed(deleted)]
+                    with metrics.timed("sheets_call", "delete_rows", rows=len(deleted)):
+                        self.spreadsheet.batch_update({"requests": requests})
+                    changes.deleted_done = deleted
+            # Edited rows, the category list, rewritten archived rows and the
+            # manifest all go in one request, so a category rename or delete
+            # is written at once however many rows it touches
+            data = []
+            for _, row, values, _ in changes.updates:
+                row = changes.shift(row)
+                data.append({"range": f"'{EXPENSES_SHEET}'!A{row}:{last_column}{row}", "values": [values]})
+            if changes.categories is not None:
+                values = self.column_values(changes.categories, CATEGORY_HEADERS[0], changes.category_rows)
+                data.append({"range": f"'{CATEGORIES_SHEET}'!A1:A{len(values)}", "values": values})
+            for (title, row), values in changes.archive_updates:
+                data.append({"range": f"'{title}'!A{row}:{last_column}{row}", "values": [values]})
+            if changes.manifest is not None:
+                data.append({"range": f"'{MANIFEST_SHEET}'!A1", "values": changes.manifest})
+            if data:
+                with metrics.timed("sheets_call", "values_batch_update", rows=len(data)):
+                    self.spreadsheet.values_batch_update(body={"valueInputOption": "RAW", "data": data})
+                changes.updates_done = True
+                changes.categories_done = changes.categories is not None
+                changes.archive_done = True
+            if changes.appends:
+                with metrics.timed("sheets_call", "append_rows", rows=len(changes.appends)):
+                    response = self.expense_sheet.append_rows(
+                        [values for _, values in changes.appends],
+                        value_input_option='RAW',
+                        table_range='A1',
+                    )
+                updated_range = response.get('updates', {}).get('updatedRange', '')
+                match = re.search(r"![A-Z]+(\d+)", updated_range)
+                changes.first_appended_row = int(match.group(1)) if match else 0
+            self.logger.info("Google Sheet updated successfully.")
+
+    def apply_sync_results(self, changes):
+            """Record what push_changes wrote; unwritten changes become pending again.
+
+            Called with the lock held. Expenses removed or edited by the menu
+            while the snapshot was being written are reconciled here.
+            """
+            alive = self.expense_index.expenses
+            touched = []
+
+            def settle(expense, row, values):
+                # Record a row just written for expense
+                synced = Expense.fingerprint_of(values)
+                if id(expense) not in alive:
+                    self.deleted_rows[row] = synced
+                    return
+                expense.row = row
+                expense.synced = synced
+                if expense.fingerprint() != synced:
+                    self.dirty_expenses.add(expense)
+                touched.append(expense)
+
+            if changes.rewrite is not None:
+                if not changes.rewrite_done:
+                    # Nothing is lost: the next sync rewrites the sheet again
+                    self.expense_layout_ok = False
+                else:
+                    self.deleted_rows = {}
+                    for row, (expense, values) in enumerate(changes.rewrite, start=2):
+                        settle(expense, row, values)
+                    self.expense_layout_ok = True
+            else:
+                if changes.deleted_done:
+                    for expense in self.expenses:
+                        if expense.row is not None:
+                            expense.row = changes.shift(expense.row)
+                    touched.extend(self.expenses)
+                    self.deleted_rows = {changes.shift(row): synced for row, synced in self.deleted_rows.items()}
+                else:
+                    self.deleted_rows.update(changes.deleted)
+                for expense, row, values, _ in changes.updates:
+                    if changes.updates_done:
+                        settle(expense, changes.shift(row), values)
+                    elif id(expense) in alive:
+                        self.dirty_expenses.add(expense)
+                if changes.first_appended_row is not None:
+                    first_row = changes.first_appended_row or max(
+                        (e.row for e in self.expenses if e.row is not None), default=1) + 1
+                    for offset, (expense, values) in enumerate(changes.appends):
+                        settle(expense, first_row + offset, values)
+                else:
+                    unsaved = [expense for expense, _ in changes.appends if id(expense) in alive]
+                    self.unsaved_expenses = unsaved + self.unsaved_expenses
+
+            if changes.categories_done:
+                self.saved_categories = changes.categories
+                self.category_rows = len(changes.categories)
+            if changes.archive_done:
+                if changes.manifest is not None and self.archive.to_rows() == changes.manifest:
+                    self.archive.dirty = False
+            else:
+                for key, values in changes.archive_updates:
+                    # A newer rewrite of the same row wins
+                    self.archive_updates.setdefault(key, values)
+            if changes.archive_updates or changes.manifest is not None:
+                self.save_archive_state()
+            self.sync_conflicts.extend(changes.conflicts)
+            self.rejected_edits.update(changes.rejected)
+            if self.store is not None:
+                self.save_sheet_state(touched)
+
+    def push_pending_changes(self, rewrite=False):
+            """Write pending changes to Google Sheets; errors are raised.
+
+            The lock is only held while the changes are taken and while the
+            results are applied, so the menu never waits on the network.
+            """
+            if self.spreadsheet is None:
+                return
+            if self.sheet_problem is not None:
+                raise RuntimeError(f"Not saving to Google Sheets: {self.sheet_problem}")
+            with self.sync_lock:
+                with self.lock:
+                    changes = self.take_pending_changes(rewrite)
+                if changes.empty():
+                    return
+                try:
+                    with metrics.timed("sync", "push"):
+                        self.open_worksheets()
+                        self.push_changes(changes)
+                finally:
+                    with self.lock:
+                        self.apply_sync_results(changes)
+
+    def sync(self, rewrite=False):
+            """Push pending local changes to Google Sheets.
+
+            Returns:
+                bool: True if the sheet is up to date with the local changes.
+            """
             try:
-                # Use batch update for efficiency
-                self.expense_sheet.update(range_name=start_cell, values=data, value_input_option='USER_ENTERED')
-                self.logger.info("Google Sheet updated successfully.")
+                self.push_pending_changes(rewrite)
+                return True
             except Exception as e:
-                self.logger.error(f"Error updating Google Sheet: {e}")
+                self.logger.error(f"Error syncing with Google Sheets: {e}")
+                return False
 
     def save_expenses(self):
-            """Save expenses data to Google Sheets."""
+            """Save pending expense changes to Google Sheets.
+
+            Only the changes since the last save are written: removed rows are
+            deleted, edited rows are updated in place and new expenses are appended.
+            """
+            if not self.sync():
+                print("Failed to save expenses to Google Sheets.")
+
+    def compact_expenses(self):
+            """Rewrite the whole expenses worksheet from the ledger (compact/resync).
+
+            Changes made on the sheet are merged first so the rewrite keeps them.
+            Blank rows, rows that are not expenses and misplaced columns are gone
+            afterwards. Run by `python run.py --compact`.
+
+            Returns:
+                bool: True if the worksheet was rewritten.
+            """
             try:
-                expense_data = self.prepare_expense_data_for_sheet()
-                self.update_sheet_data(expense_data)
+                self.refresh_from_sheet(force=True)
             except Exception as e:
-                self.logger.error(f"Error saving expenses to Google Sheets: {e}")
+                self.logger.error(f"Error refreshing from Google Sheets: {e}")
+                print("Failed to refresh from Google Sheets; the expenses worksheet was not rewritten.")
+                return False
+            if not self.sync(rewrite=True):
                 print("Failed to save expenses to Google Sheets.")
+                return False
+            print(f"Expenses worksheet rewritten with {len(self.expenses)} expenses.")
+            return True
+
+    def has_pending_changes(self):
+            """Return True if there are local changes not yet on the sheet."""
+            with self.lock:
+                return bool(
+                    self.deleted_rows
+                    or self.dirty_expenses
+                    or self.unsaved_expenses
+                    or not self.expense_layout_ok
+                    or self.expense_categories.names() != self.saved_categories
+                    or self.archive_updates
+                    or self.archive.dirty
+                )
+
+    def archive_closed_months(self, hot_months=HOT_MONTHS):
+            """Move the expenses of closed months out of the expenses worksheet.
+
+            Expenses older than the last hot_months months are appended to one
+            worksheet per month and deleted from the expenses worksheet, and
+            their row counts and category totals are added to the archive
+            manifest. The expenses worksheet, and with it every load, refresh
+            and rewrite, then only holds recent months. Rows changed on the
+            sheet since the last sync stay where they are. Pending changes are
+            saved first. Meant to run before the menu starts: the lock is held
+            while the sheet is written. Errors are raised.
+
+            Returns:
+                list: the (year, month) tuples archived.
+            """
+            if self.spreadsheet is None or self.sheet_problem is not None:
+                return []
+            today = datetime.now()
+            year, month = divmod(today.year * 12 + today.month - hot_months, 12)
+            last_closed_day = date(year, month + 1, 1) - timedelta(days=1)
+            if not self.expense_index.date_range(end=last_closed_day) and not self.archive.dirty:
+                return []
+            if self.has_pending_changes():
+                self.push_pending_changes()
+            by_month = defaultdict(list)
+            with self.sync_lock, self.lock:
+                self.open_worksheets()
+                closed = [self.expense_index.expenses[key] for key in self.expense_index.date_range(end=last_closed_day)]
+                # Expenses changed since the save stay until they are on the sheet
+                closed = [expense for expense in closed if expense.row is not None and expense not in self.dirty_expenses]
+                # The rows are deleted by number: check they still hold these
+                # expenses, as the sheet may have been sorted or archived by
+                # another client since the last refresh
+                changed = self.changed_rows({expense.row: expense.synced for expense in closed})
+                if changed:
+                    self.logger.warning(f"{len(changed)} rows to archive were changed on the sheet since the "
+                                        f"last sync; they are left until the next refresh.")
+                    closed = [expense for expense in closed if expense.row not in changed]
+                for expense in sorted(closed, key=lambda expense: expense.row):
+                    by_month[(expense.date.year, expense.date.month)].append(expense)
+                if by_month:
+                    with metrics.timed("archive", "months", rows=len(closed)):
+                        # Written before the rows are deleted: if the deletion
+                        # fails, the next run writes the same rows again
+                        self.write_archive_worksheets(by_month)
+                        self.remove_archived_rows(by_month)
+                if self.archive.dirty:
+                    self.write_manifest()
+            if by_month:
+                self.logger.info(f"Archived {len(closed)} expenses of {len(by_month)} closed months.")
+            return sorted(by_month)
+
+    def write_archive_worksheets(self, by_month):
+            """Append expenses to their month's worksheet, adding the worksheets that don't exist.
+
+            Called with the lock held. One request adds or grows the worksheets
+            and one writes all the rows.
+            """
+            requests = []
+            data = []
+            for month, expenses in by_month.items():
+                title = shard_title(month)
+                values = [expense.to_row() for expense in expenses]
+                if title in self.sheet_ids:
+                    requests.append({"appendDimension": {
+                        "sheetId": self.sheet_ids[title], "dimension": "ROWS", "length": len(values),
+                    }})
+                else:
+                    requests.append({"addSheet": {"properties": {
+                        "title": title,
+                        "gridProperties": {"rowCount": len(values) + 1, "columnCount": len(EXPENSE_HEADERS)},
+                    }}})
+                archived_rows = self.archive.rows.get(month, 0)
+                if archived_rows:
+                    data.append({"range": f"'{title}'!A{archived_rows + 2}", "values": values})
+                else:
+                    data.append({"range": f"'{title}'!A1", "values": [EXPENSE_HEADERS] + values})
+            if MANIFEST_SHEET not in self.sheet_ids:
+                requests.append({"addSheet": {"properties": {"title": MANIFEST_SHEET}}})
+            with metrics.timed("sheets_call", "add_sheets", rows=len(requests)):
+                response = self.spreadsheet.batch_update({"requests": requests})
+            for reply in response.get("replies", []):
+                properties = reply.get("addSheet", {}).get("properties")
+                if properties:
+                    self.sheet_ids[properties["title"]] = properties["sheetId"]
+            with metrics.timed("sheets_call", "values_batch_update", rows=sum(len(item["values"]) for item in data)):
+                self.spreadsheet.values_batch_update(body={"valueInputOption": "RAW", "data": data})
+
+    def remove_archived_rows(self, by_month):
+            """Delete archived expenses from the expenses worksheet and the ledger.
+
+            Called with the lock held. Runs of adjacent rows are deleted by one
+            request each, bottom-up, in a single batch.
+            """
+            rows = sorted(expense.row for expenses in by_month.values() for expense in expenses)
+            runs = row_runs(rows)
+            requests = [{
+                "deleteDimension": {
+                    "range": {
+                        "sheetId": self.expense_sheet.id,
+                        "dimension": "ROWS",
+                        "startIndex": first - 1,
+                        "endIndex": last,
+                    }
+                }
+            } for first, last in reversed(runs)]
+            with metrics.timed("sheets_call", "delete_rows", rows=len(rows)):
+                self.spreadsheet.batch_update({"requests": requests})
+
+            archived = []
+            for month, expenses in by_month.items():
+                self.archive.add(month, expenses)
+                # Loaded again with the new rows when next needed
+                self.archived_expenses.pop(month, None)
+                archived.extend(expenses)
+            archived_ids = {id(expense) for expense in archived}
+            self.expenses[:] = [expense for expense in self.expenses if id(expense) not in archived_ids]
+            # Rebuilt rather than updated per expense: the first run can move
+            # most of the ledger
+            self.aggregates = ExpenseAggregates(self.expenses)
+            self.expense_index = ExpenseIndex(self.expenses)
+            self.rejected_edits.difference_update(archived)
+            for expense in self.expenses:
+                if expense.row is not None:
+                    expense.row -= bisect_left(rows, expense.row)
+            self.deleted_rows = {row - bisect_left(rows, row): synced for row, synced in self.deleted_rows.items()}
+            if self.store is not None:
+                self.store.apply_refresh([expense for expense in self.expenses if expense.row is not None], archived,
+                                         self.dirty_expenses, self.deleted_rows)
+                self.save_archive_state()
+
+    def write_manifest(self):
+            """Write the archive manifest to its worksheet. Errors are raised."""
+            rows = self.archive.to_rows()
+            with metrics.timed("sheets_call", "values_batch_update", rows=len(rows)):
+                self.spreadsheet.values_batch_update(body={
+                    "valueInputOption": "RAW",
+                    "data": [{"range": f"'{MANIFEST_SHEET}'!A1", "values": rows}],
+                })
+            self.archive.dirty = False
+            self.save_archive_state()
+
+    def archive_months(self):
+            """Archive closed months, reporting failures to the user."""
+            try:
+                months = self.archive_closed_months()
+            except Exception as e:
+                self.logger.error(f"Error archiving closed months: {e}")
+                print("Failed to archive closed months to Google Sheets.")
+                return
+            if months:
+                print(f"Archived {len(months)} closed month(s) to their own worksheets.")
+
+    def load_archived_months(self, months):
+            """Return the expenses of archived months, reading the ones not loaded yet in one request.
+
+            Archived expenses are read-only: they are not part of the ledger.
+            """
+            missing = [month for month in months if month not in self.archived_expenses]
+            if missing and self.spreadsheet is not None:
+                try:
+                    sheet_values = self.fetch_sheet_values(*(shard_title(month) for month in missing))
+                except Exception:
+                    print("Failed to load archived months from Google Sheets.")
+                else:
+                    with self.lock:
+                        for month in missing:
+                            expenses = []
+                            for row, values in enumerate(sheet_values[shard_title(month)][1:], start=2):
+                                expense = self.expense_from_row(values)
+                                if expense is None:
+                                    continue
+                                # Row in the month's worksheet, for category renames
+                                expense.row = row
+                                self.expense_categories.bind(expense)
+                                expenses.append(expense)
+                            self.archived_expenses[month] = expenses
+            return [expense for month in months for expense in self.archived_expenses.get(month, [])]
+
+    def all_expenses(self):
+            """Return the expenses of every archived month followed by the ledger."""
+            return self.load_archived_months(self.archive.months) + self.expenses
+
+    def fetch_remote_modified(self):
+            """Return the spreadsheet's last modification time (one Drive API request)."""
+            with metrics.timed("sheets_call", "last_update_time"):
+                self.spreadsheet.refresh_lastUpdateTime()
+                return self.spreadsheet.lastUpdateTime
+
+    def refresh_from_sheet(self, force=False):
+            """Merge changes made on the sheet by others into the local ledger.
+
+            The sheet's modification time is checked first, so an unchanged sheet
+            costs one small request. Otherwise the sheet is read once and each row
+            is compared with the fingerprint recorded at the last sync; only rows
+            that were added, edited, moved or deleted touch the ledger, its
+            indexes and the local store. Local changes not yet saved are kept,
+            except where the same row was changed on the sheet: as in
+            detect_conflicts, the sheet wins and the conflict is reported.
+
+            Args:
+                force (bool): compare the rows even if the modification time
+                    looks unchanged.
+
+            Returns:
+                RefreshResult: the changes merged, or None if the sheet was unchanged.
+                Errors are raised.
+            """
+            if self.spreadsheet is None:
+                return None
+            # No sync may write to the sheet between the read and the merge
+            with self.sync_lock:
+                # Read before the values, so later edits show up as a new time
+                modified = self.fetch_remote_modified()
+                if not force and modified is not None and modified == self.remote_modified:
+                    return None
+                self.open_worksheets()
+                titles = [EXPENSES_SHEET, CATEGORIES_SHEET]
+                if MANIFEST_SHEET in self.sheet_ids:
+                    titles.append(MANIFEST_SHEET)
+                sheet_values = self.fetch_sheet_values(*titles)
+                with self.lock, metrics.timed("refresh", "merge") as span:
+                    result = RefreshResult()
+                    if self.merge_remote_rows(sheet_values[EXPENSES_SHEET], result):
+                        self.remote_modified = modified
+                    self.merge_remote_categories(sheet_values[CATEGORIES_SHEET], result)
+                    span.rows = len(result.added) + len(result.updated) + len(result.removed)
+                    if self.store is not None:
+                        self.store.apply_refresh(result.added + result.updated + result.moved, result.removed,
+                                                 self.dirty_expenses, self.deleted_rows)
+                        self.save_sheet_state([])
+                if MANIFEST_SHEET not in sheet_values and result.removed:
+                    # The rows may have been archived by another client for the first time
+                    self.open_worksheets(reload=True)
+                    if MANIFEST_SHEET in self.sheet_ids:
+                        sheet_values.update(self.fetch_sheet_values(MANIFEST_SHEET))
+                if MANIFEST_SHEET in sheet_values:
+                    with self.lock:
+                        self.merge_remote_manifest(sheet_values[MANIFEST_SHEET], result)
+            if result.changed():
+                self.logger.info(f"Refreshed from Google Sheets: {result}")
+            return result
+
+    def merge_remote_rows(self, rows, result):
+            """Apply the differences between the expenses worksheet rows and the ledger.
+
+            Called with the lock held.
+
+            Returns:
+                bool: False if the sheet layout isn't the expected one and nothing
+                was merged; the next sync rewrites the sheet in that case.
+            """
+            if not self.expense_layout_ok or not rows or rows[0][:len(EXPENSE_HEADERS)] != EXPENSE_HEADERS:
+                self.logger.warning("Expenses worksheet layout differs from the expected headers; not refreshed.")
+                return False
+
+            # Rows as the last sync left them: an expense, or None for a row
+            # deleted locally but not yet on the sheet. Entries whose row number
+            # is already taken (left stale by another editor's changes) are only
+            # matched by content.
+            known = {}
+            stale = []
+            for expense in self.expenses:
+                if expense.row is not None:
+                    if expense.row in known:
+                        stale.append((expense.row, (expense.synced, expense)))
+                    else:
+                        known[expense.row] = (expense.synced, expense)
+            for row, synced in self.deleted_rows.items():
+                if row in known:
+                    stale.append((row, (synced, None)))
+                else:
+                    known[row] = (synced, None)
+
+            deleted_rows = {}  # Local deletions still to be made, at their new rows
+
+            def settle(entry, row, values):
+                # The entry's row is still on the sheet, now at row
+                synced, expense = entry
+                if expense is None:
+                    deleted_rows[row] = synced
+                    return
+                if expense.row != row:
+                    expense.row = row
+                    result.moved.append(expense)
+                if expense in self.rejected_edits and expense not in self.dirty_expenses:
+                    # Still holds the edit detect_conflicts refused to write
+                    self.replace_expense_values(expense, values)
+                    result.updated.append(expense)
+
+            # Unchanged rows in place are the common case and are settled first
+            unmatched = {}  # Row -> (fingerprint, values)
+            for row, values in enumerate(rows[1:], start=2):
+                if self.parse_amount(values[1] if len(values) > 1 else "") is None:
+                    continue  # Not an expense row; load_expenses skips it too
+                fingerprint = Expense.fingerprint_of(values)
+                entry = known.get(row)
+                if entry is not None and entry[0] == fingerprint:
+                    del known[row]
+                    settle(entry, row, values)
+                else:
+                    unmatched[row] = (fingerprint, values)
+
+            # Rows shifted by insertions or deletions are matched by content
+            by_fingerprint = {}
+            for old_row, entry in sorted(list(known.items()) + stale, key=lambda item: item[0]):
+                by_fingerprint.setdefault(entry[0], []).append((old_row, entry))
+            new_rows = []
+            for row, (fingerprint, values) in unmatched.items():
+                candidates = by_fingerprint.get(fingerprint)
+                if not candidates:
+                    new_rows.append(row)
+                    continue
+                old_row, entry = candidates.pop(0)
+                if known.get(old_row) is entry:
+                    del known[old_row]
+                else:
+                    stale.remove((old_row, entry))
+                settle(entry, row, values)
+
+            # What is left in known was edited in place or deleted on the sheet
+            removed = set()
+            for row in new_rows:
+                fingerprint, values = unmatched[row]
+                synced, expense = known.pop(row, (None, None))
+                if expense is not None:
+                    if expense in self.dirty_expenses:
+                        self.dirty_expenses.discard(expense)
+                        self.sync_conflicts.append((row, values))
+                    self.replace_expense_values(expense, values)
+                    expense.synced = fingerprint
+                    result.updated.append(expense)
+                    continue
+                if synced is not None:
+                    # Deleted here but edited there: keep the sheet's version
+                    self.sync_conflicts.append((row, values))
+                expense = self.expense_from_row(values)
+                if expense is None:
+                    continue
+                expense.row = row
+                expense.synced = fingerprint
+                self.expense_categories.bind(expense)
+                self.aggregates.add(expense)
+                self.expense_index.add(expense)
+                result.added.append(expense)
+            for row, (synced, expense) in list(known.items()) + stale:
+                if expense is None:
+                    continue  # Already deleted on the sheet as well
+                if expense in self.dirty_expenses:
+                    self.dirty_expenses.discard(expense)
+                    self.sync_conflicts.append((row, []))
+                self.aggregates.remove(expense)
+                self.expense_index.remove(expense)
+                removed.add(id(expense))
+                result.removed.append(expense)
+            self.deleted_rows = deleted_rows
+            self.rejected_edits.clear()
+
+            if result.added or result.moved or removed:
+                # Keep the ledger in sheet order, new local expenses last
+                unsaved = [expense for expense in self.expenses if expense.row is None]
+                on_sheet = [expense for expense in self.expenses
+                            if expense.row is not None and id(expense) not in removed]
+                on_sheet.extend(result.added)
+                on_sheet.sort(key=lambda expense: expense.row)
+                self.expenses[:] = on_sheet + unsaved
+            return True
+
+    def merge_remote_categories(self, rows, result):
+            """Adopt the sheet's category list unless categories were changed locally.
+
+            Called with the lock held.
+            """
+            index = rows[0].index("Category") if rows and "Category" in rows[0] else None
+            if index is None:
+                return
+            remote = [str(row[index]) for row in rows[1:] if index < len(row) and row[index] != ""]
+            local_changes = self.expense_categories.names() != self.saved_categories
+            self.category_rows = len(rows) - 1
+            if remote == self.saved_categories:
+                return
+            self.saved_categories = list(remote)
+            if not local_changes:
+                # Updated in place: menus hold references to the registry
+                self.expense_categories.replace(remote)
+                result.categories_changed = True
+                if self.store is not None:
+                    self.store.save_categories(self.expense_categories)
+
+    def merge_remote_manifest(self, rows, result):
+            """Adopt the archive manifest written by another client.
+
+            Called with the lock held. A manifest not yet written from here is kept.
+            Archived months whose entry changed, by new rows or by a category
+            rename or delete on another client, are read again when next needed.
+            """
+            if self.archive.dirty:
+                return
+            remote = ArchiveManifest.from_rows(rows)
+            if remote.rows == self.archive.rows and remote.category_totals == self.archive.category_totals:
+                return
+            result.archived = [month for month in remote.months if month not in self.archive]
+            for month in set(remote.rows) | set(self.archive.rows):
+                if (remote.rows.get(month) != self.archive.rows.get(month)
+                        or remote.category_totals.get(month) != self.archive.category_totals.get(month)):
+                    self.archived_expenses.pop(month, None)
+            self.archive = remote
+            self.save_archive_state()
+
+    def expense_from_row(self, values):
+            """Build an Expense from a worksheet row in EXPENSE_HEADERS order, or None if invalid."""
+            values = list(values) + [""] * (len(EXPENSE_HEADERS) - len(values))
+            amount = self.parse_amount(values[1])
+            if amount is None:
+                return None
+            try:
+                return Expense(values[0], amount, values[2], values[3] or PLACEHOLDER_DATE)
+            except ValueError as e:
+                self.logger.error(f"Skipping expense row {values}: {e}")
+                return None
+
+    def replace_expense_values(self, expense, values):
+            """Overwrite an expense with the values of its worksheet row. Called with the lock held."""
+            updated = self.expense_from_row(values)
+            if updated is None:
+                return
+            self.aggregates.remove(expense)
+            self.expense_index.remove(expense)
+            expense.name = updated.name
+            expense.amount = updated.amount
+            expense.category = updated.category
+            expense.date = updated.date
+            self.expense_categories.bind(expense)
+            self.aggregates.add(expense)
+            self.expense_index.add(expense)
+
+    def start_background_refresh(self, interval=REFRESH_INTERVAL):
+            """Check the sheet for changes by others every interval seconds in a background thread."""
+            if self._spreadsheet is None or self.refresh_thread is not None:
+                return
+            self.refresh_stop.clear()
+            self.refresh_thread = threading.Thread(
+                target=self._poll_sheet, args=(interval,), name="sheet-refresh", daemon=True
+            )
+            self.refresh_thread.start()
+
+    def stop_background_refresh(self):
+            """Stop the background refresh thread."""
+            if self.refresh_thread is None:
+                return
+            self.refresh_stop.set()
+            self.refresh_thread.join()
+            self.refresh_thread = None
+
+    def _poll_sheet(self, interval):
+            while not self.refresh_stop.wait(interval):
+                try:
+                    result = self.refresh_from_sheet()
+                except Exception as e:
+                    self.logger.error(f"Error refreshing from Google Sheets: {e}")
+                    continue
+                if result is not None and result.changed():
+                    with self.lock:
+                        self.refresh_results.append(result)
 
-    def load_categories(self):
-            """Load expense categories from Google Sheets."""
+    def refresh(self):
+            """Menu action: pull changes made on the sheet by others."""
             try:
-                categories = self.load_data(self.categories_sheet, "Category")
-                print("Loaded categories:", categories)  
+                result = self.refresh_from_sheet()
+            except Exception as e:
+                self.logger.error(f"Error refreshing from Google Sheets: {e}")
+                print("Failed to refresh from Google Sheets.")
+                return
+            if result is None or not result.changed():
+                print("Already up to date with Google Sheets.")
+            else:
+                print(f"Updated from Google Sheets: {result}.")
+
+    def start_background_sync(self):
+            """Start the write-behind worker that saves changes to Google Sheets."""
+            # Checked without opening the spreadsheet; the worker opens it
+            if self._spreadsheet is not None:
+                self.write_queue.start()
+
+    def stop_background_sync(self):
+            """Write everything still queued and stop the write-behind worker."""
+            if self.write_queue.running:
+                print("Saving changes to Google Sheets...")
+                self.write_queue.close()
+                self.report_sync_status()
+
+    def report_sync_status(self):
+            """Print failed background writes and conflicts since the last report."""
+            for error in self.write_queue.take_errors():
+                print(self.colorize(f"Saving to Google Sheets failed ({error}); changes will be retried.", 'red'))
+            with self.lock:
+                conflicts, self.sync_conflicts = self.sync_conflicts, []
+            for row, _ in conflicts:
+                print(self.colorize(f"Row {row} was changed on the sheet by someone else; your change to it was not saved.", 'red'))
+            with self.lock:
+                results, self.refresh_results = self.refresh_results, []
+            for result in results:
+                print(f"Updated from Google Sheets: {result}.")
+
+    def commit_changes(self, action="change"):
+            """Persist the changes made by a menu action.
+
+            Changes are handed to the write-behind worker when it is running, so
+            the menu returns immediately; otherwise they are written to Google
+            Sheets straight away unless a local store keeps them until the next sync.
+            """
+            if self.store is not None:
+                self.store.save_categories(self.expense_categories)
+            if self.write_queue.running:
+                self.write_queue.submit(action)
+            elif self.store is None:
+                self.save_expenses()
+
+    def load_categories(self, rows=None):
+            """Load expense categories from the rows of the categories worksheet."""
+            try:
+                if rows is None:
+                    rows = self.fetch_sheet_values(CATEGORIES_SHEET)[CATEGORIES_SHEET]
+                if not rows:
+                    return []
+                columns = self.map_columns(rows[0], CATEGORY_HEADERS)
+                if "Category" not in columns:
+                    return []
+                index = columns["Category"]
+                categories = [str(row[index]) for row in rows[1:] if index < len(row) and row[index] != ""]
+                self.saved_categories = list(categories)
+                self.category_rows = len(rows) - 1
+                print("Loaded categories:", categories)
                 return categories
             except Exception as e:
                 self.logger.error(f"Error loading categories from Google Sheets: {e}")
@@ -218,15 +1660,17 @@ class ExpenseTracker:
             """Edit an item in specified list of items."""        
             try:
                 self.display_items(self.expense_categories, item_type)
-                item_index = int(input(f"Enter the index of the {item_type.lower()} to edit: ")) - 1
+                item_index = int(prompt(f"Enter the index of the {item_type.lower()} to edit: ")) - 1
                 if item_index in range(len(self.expense_categories)):
-                    new_value = input(f"Enter the new value for '{self.expense_categories[item_index]}': ")
-                    self.expense_categories[item_index] = new_value
+                    new_value = prompt(f"Enter the new value for '{self.expense_categories[item_index]}': ")
+                    self.rename_category(item_index, new_value)
                     # Update the category in Google Sheets
-                    self.update_categories_sheet()
+                    self.commit_changes()
                     print(f"{item_type} updated successfully.")
                 else:
                     print("Invalid index.")
+            except (ValueError, RuntimeError) as e:
+                print(e)
             except Exception as e:
                 self.logger.error(f"Error editing item: {e}")
 
@@ -234,27 +1678,24 @@ class ExpenseTracker:
             """Delete item in specified list of items.""" 
             try:
                 self.display_items(self.expense_categories, item_type)
-                item_index = int(input(f"Enter the index of the {item_type.lower()} to delete: ")) - 1
+                item_index = int(prompt(f"Enter the index of the {item_type.lower()} to delete: ")) - 1
                 if item_index in range(len(self.expense_categories)):
-                    deleted_item = self.expense_categories.pop(item_index)
+                    deleted_item = self.expense_categories[item_index]
+                    replacement = None
+                    if self.category_in_use(deleted_item):
+                        print(f"Choose the category to move the expenses of '{deleted_item}' to.")
+                        replacement = self.choose_category()
+                    self.delete_category(item_index, replacement)
                     # Update the category in Google Sheets
-                    self.update_categories_sheet()
+                    self.commit_changes()
                     print(f"{item_type} '{deleted_item}' deleted successfully.")
                 else:
                     print("Invalid index.")
+            except (ValueError, RuntimeError) as e:
+                print(e)
             except Exception as e:
                 self.logger.error(f"Error deleting item: {e}")                
                 
-    def update_categories_sheet(self):
-        """Update the categories sheet in Google Sheets."""
-        try:
-            # Prepare the category data for Google Sheets
-            category_data = [["Category"]] + [[cat] for cat in self.expense_categories]
-            # Update the categories sheet with the new data
-            self.categories_sheet.update('A1', category_data, value_input_option='USER_ENTERED')
-        except Exception as e:
-            self.logger.error(f"Error updating categories in Google Sheets: {e}")
-                
     def display_items(self, items, item_type):
             """Display list of items w/ index numbers"""
             print(f"{item_type} List:")
@@ -270,15 +1711,15 @@ class ExpenseTracker:
                 print("3. Edit Item")
                 print("4. Delete Item")
                 print("5. Exit")
-                choice = input("Select an option: ")
+                choice = prompt("Select an option: ")
 
                 if choice == "1":
                     self.display_items(items, item_type)
                 elif choice == "2":
-                    new_item = input(f"Enter the new {item_type.lower()}: ")
+                    new_item = prompt(f"Enter the new {item_type.lower()}: ")
                     if new_item not in items:
                         items.append(new_item)
-                        self.save_data(self.categories_sheet, self.expense_categories, "Category")
+                        self.commit_changes()
                         print(f"{item_type} '{new_item}' added successfully.")
                     else:
                         print(f"{item_type} already exists.")
@@ -294,7 +1735,7 @@ class ExpenseTracker:
     def get_user_expense(self):
             """Get user input to create a new expense."""
             print("🎯 Getting User Expense")
-            name = input("Enter expense name: ")
+            name = prompt("Enter expense name: ")
             amount = self.get_valid_amount()
             date_str = self.get_valid_date()
             category = self.choose_category()
@@ -304,7 +1745,9 @@ class ExpenseTracker:
             """Get and validate expense amount from user."""
             while True:
                 try:
-                    amount = float(input("Enter expense amount: "))
+                    amount = self.parse_amount(prompt("Enter expense amount: "))
+                    if amount is None:
+                        raise ValueError("Amount must be a number.")
                     if amount < 0:
                         raise ValueError("Amount cannot be negative.")
                     return amount
@@ -314,9 +1757,9 @@ class ExpenseTracker:
     def get_valid_date(self):
             """Get and validate expense date from user."""
             while True:
-                date_str = input("Enter expense date (DD-MM-YYYY): ")
+                date_str = prompt("Enter expense date (DD-MM-YYYY): ")
                 try:
-                    datetime.strptime(date_str, "%d-%m-%Y")
+                    datetime.strptime(date_str, DATE_FORMAT)
                     return date_str
                 except ValueError:
                     print("Invalid date format. Please use DD-MM-YYYY.")
@@ -328,7 +1771,7 @@ class ExpenseTracker:
                 for i, category_name in enumerate(self.expense_categories, start=1):
                     print(f"{i}. {category_name}")
                 try:
-                    selected_index = int(input("Enter a category number: ")) - 1
+                    selected_index = int(prompt("Enter a category number: ")) - 1
                     if 0 <= selected_index < len(self.expense_categories):
                         return self.expense_categories[selected_index]
                     else:
@@ -336,60 +1779,145 @@ class ExpenseTracker:
                 except ValueError:
                     print("Please enter a valid number.")                 
 
-    def display_expenses(self):
-            """Display the list of expenses in a table."""
-            if not self.expenses:
+    def archived_months_between(self, start=None, end=None):
+            """Return the archived (year, month) tuples overlapping start..end."""
+            first = None if start is None else (start.year, start.month)
+            last = None if end is None else (end.year, end.month)
+            return [month for month in self.archive.months
+                    if (first is None or month >= first) and (last is None or month <= last)]
+
+    def filter_expenses(self, start=None, end=None, category=None, name=None, min_amount=None, max_amount=None):
+            """Return the expenses matching the given filters.
+
+            Without filters this is the whole ledger in its stored order; with
+            filters the matches come from the date and category indexes, in date
+            order. Filters also search the archived months in their date range,
+            whose worksheets are read the first time they are needed.
+            """
+            if all(value is None for value in (start, end, category, name, min_amount, max_amount)):
+                return self.expenses
+            archived = self.load_archived_months(self.archived_months_between(start, end))
+            category_id = None
+            if category is not None:
+                category_id = self.expense_categories.id_of(category)
+                if category_id is None:
+                    return []
+            filters = (start, end, category_id, name, min_amount, max_amount)
+            matches = list(self.expense_index.search(*filters))
+            if archived:
+                archived = ExpenseIndex(archived).search(*filters)
+                matches = sorted(matches + list(archived), key=lambda expense: expense.date)
+            return matches
+
+    def get_expense_filters(self):
+            """Prompt for optional expense filters; Enter skips a filter."""
+            filters = {}
+            if prompt("Filter expenses? (y/N): ").strip().lower() != "y":
+                return filters
+            for key, label in (("start", "From date (DD-MM-YYYY)"), ("end", "To date (DD-MM-YYYY)")):
+                while True:
+                    value = prompt(f"{label}, or press Enter to skip: ")
+                    if not value:
+                        break
+                    try:
+                        filters[key] = parse_date(value).date()
+                        break
+                    except ValueError:
+                        print("Invalid date format. Please use DD-MM-YYYY.")
+            self.display_items(self.expense_categories, "Category")
+            category_index = prompt("Category number, or press Enter to skip: ")
+            if category_index.isdigit() and int(category_index) - 1 in range(len(self.expense_categories)):
+                filters["category"] = self.expense_categories[int(category_index) - 1]
+            name = prompt("Name contains, or press Enter to skip: ")
+            if name:
+                filters["name"] = name
+            for key, label in (("min_amount", "Minimum amount"), ("max_amount", "Maximum amount")):
+                value = self.parse_amount(prompt(f"{label}, or press Enter to skip: "))
+                if value is not None:
+                    filters[key] = value
+            return filters
+
+    def display_expenses(self, expenses=None, page_size=PAGE_SIZE):
+            """Display expenses in a table, one page at a time.
+
+            Only the rows of the page being shown are formatted. Index numbers
+            refer to positions in the given list (the whole ledger by default).
+            """
+            if expenses is None:
+                expenses = self.expenses
+            if not expenses:
                 print("No expenses found.")
                 return
 
-            table_data = []
+            from tabulate import tabulate
             headers = ["Index", "Date", "Expense Name", "Category", "Amount"]
-
-            for i, expense in enumerate(self.expenses, start=1):
-                table_data.append([i, expense.date.strftime('%d/%m/%Y'), expense.name, expense.category, f"€{expense.amount:.2f}"])
-
-            print(tabulate(table_data, headers, tablefmt="pretty"))
+            page_count = (len(expenses) + page_size - 1) // page_size
+            page = 0
+            while True:
+                start = page * page_size
+                table_data = [
+                    [i, expense.date.strftime('%d/%m/%Y'), expense.name, expense.category, f"€{expense.amount:.2f}"]
+                    for i, expense in enumerate(expenses[start:start + page_size], start=start + 1)
+                ]
+                print(tabulate(table_data, headers, tablefmt="pretty"))
+                if page_count == 1:
+                    return
+                print(f"Page {page + 1} of {page_count}")
+                choice = prompt("Press Enter for the next page, 'p' for the previous page or 'q' to stop: ").strip().lower()
+                if choice == "q":
+                    return
+                if choice == "p":
+                    page = max(page - 1, 0)
+                elif page + 1 < page_count:
+                    page += 1
+                else:
+                    return
 
     def edit_or_remove_expense(self):
             
             """Edit or remove an expense from the list of expenses."""
-            self.display_expenses()
-            expense_index = int(input("Enter the index of the expense to edit/remove: ")) - 1
+            expenses = self.filter_expenses(**self.get_expense_filters())
+            self.display_expenses(expenses)
+            expense_index = int(prompt("Enter the index of the expense to edit/remove: ")) - 1
 
-            if expense_index in range(len(self.expenses)):
-                selected_expense = self.expenses[expense_index]
+            if expense_index in range(len(expenses)):
+                selected_expense = expenses[expense_index]
+                if id(selected_expense) not in self.expense_index.expenses:
+                    print("Expenses of archived months can't be changed.")
+                    return
 
                 print(f"Selected Expense: {selected_expense}")
                 print("1. Edit Expense")
                 print("2. Remove Expense")
-                edit_or_remove_choice = input("Select an option (1 or 2): ")
+                edit_or_remove_choice = prompt("Select an option (1 or 2): ")
 
                 if edit_or_remove_choice == "1":
                     # Edit Expense
-                    updated_name = input("Enter the updated expense name (or press Enter to keep the current name): ")
-                    updated_amount = input("Enter the updated expense amount (or press Enter to keep the current amount): ")
+                    updated_name = prompt("Enter the updated expense name (or press Enter to keep the current name): ")
+                    updated_amount = prompt("Enter the updated expense amount (or press Enter to keep the current amount): ")
 
                     # Display categories for selection
                     self.display_items(self.expense_categories, "Category")
-                    selected_category_index = input("Enter the number of the existing category to update (or press Enter to keep the current category): ")
+                    selected_category_index = prompt("Enter the number of the existing category to update (or press Enter to keep the current category): ")
+                    selected_category = None
                     if selected_category_index:
                         selected_category_index = int(selected_category_index) - 1
                         if selected_category_index in range(len(self.expense_categories)):
                             selected_category = self.expense_categories[selected_category_index]
-                            selected_expense.category = selected_category                    
 
-                    if updated_name:
-                        selected_expense.name = updated_name
-                    if updated_amount:
-                        selected_expense.amount = float(updated_amount)
-
-                    self.save_expenses()
+                    self.update_expense(
+                        selected_expense,
+                        name=updated_name or None,
+                        amount=float(updated_amount) if updated_amount else None,
+                        category=selected_category,
+                    )
+                    self.commit_changes()
                     print("Expense updated successfully.")
 
                 elif edit_or_remove_choice == "2":
                     # Remove Expense
-                    removed_expense = self.expenses.pop(expense_index)
-                    self.save_expenses()
+                    removed_expense = self.remove_expense(self.expenses.index(selected_expense))
+                    self.commit_changes()
                     print(f"Expense '{removed_expense}' removed successfully.")
                 else:
                     print("Invalid option.")
@@ -397,14 +1925,19 @@ class ExpenseTracker:
                 print("Invalid expense index.")
                 
     def run_menu_option(self, option):
+            """Run the selected menu option, timing it in the metrics registry."""
+            with metrics.timed("menu_action", MENU_ACTIONS.get(option, "invalid")):
+                return self.dispatch_menu_option(option)
+
+    def dispatch_menu_option(self, option):
             """Run the selected menu option."""
             if option == "1":
                 expense = self.get_user_expense()
-                self.expenses.append(expense)
-                self.save_expenses()
+                self.add_expense(expense)
+                self.commit_changes()
                 print("Expense added successfully.")
             elif option == "2":
-                self.display_expenses()
+                self.display_expenses(self.filter_expenses(**self.get_expense_filters()))
             elif option == "3":
                 self.edit_or_remove_expense()
             elif option == "4":
@@ -414,17 +1947,28 @@ class ExpenseTracker:
             elif option == "5":
                 self.manage_items(self.expense_categories, "Category")
             elif option == "6":
-                self.summarize_expenses()
+                self.summarize_expenses(self.get_summary_month())
             elif option == "7":
+                from reports import print_reports  # Loads NumPy
+                print_reports(self.all_expenses(), self.user_budget or 0, self.get_summary_month())
+            elif option == "8":
+                self.refresh()
+            elif option == "9":
                 return "exit"  # Signal to exit the loop
             else:
                 print("Invalid choice. Please try again.")
             
     def run(self):
         """Run the main application loop."""
+        if self.sheet_problem is not None:
+            print(self.colorize(f"Google Sheets is not updated: {self.sheet_problem}. Fix the header row "
+                                f"and rows of the expenses worksheet, then restart.", 'red'))
+        self.archive_months()
+        self.start_background_sync()
+        self.start_background_refresh()
         try:
-            self.load_expenses()  # Load expenses once at the start
             while True:
+                self.report_sync_status()
                 print("Expense Tracker Menu")
                 print("1. Add Expense")
                 print("2. Display Expenses")
@@ -432,11 +1976,13 @@ class ExpenseTracker:
                 print("4. Adjust Monthly Budget")
                 print("5. Manage Categories")
                 print("6. Summarize Expenses")
-                print("7. Exit")
+                print("7. Reports")
+                print("8. Refresh from Google Sheets")
+                print("9. Exit")
 
-                option = input("Select an option: ")
-                if option == "7":
-                    break  # Exit the loop if option 7 is selected
+                option = prompt("Select an option: ")
+                if option == "9":
+                    break  # Exit the loop if option 9 is selected
                 self.run_menu_option(option)
         
         except KeyboardInterrupt:
@@ -447,14 +1993,42 @@ class ExpenseTracker:
         except Exception as e:
             self.logger.error(f"Unexpected error in the main loop: {e}")
             print("An unexpected error occurred. Exiting the application.")
+        finally:
+            # Write changes still queued, including after Ctrl+C
+            self.stop_background_refresh()
+            self.stop_background_sync()
+            self.dump_metrics()
+
+    def dump_metrics(self):
+            """Write the metrics to the file named by EXPENSE_TRACKER_METRICS, if set.
+
+            Files ending in .prom get the Prometheus text format, others JSON.
+            """
+            path = os.environ.get(METRICS_FILE_VARIABLE)
+            if not path:
+                return
+            try:
+                metrics.REGISTRY.dump(path)
+            except OSError as e:
+                self.logger.error(f"Error writing metrics to {path}: {e}")
                     
 
     def main(self):
             """Main function that initializes logging and runs the application."""
             print(f"🎯 Running Expense Tracker!")
             logging.basicConfig(level=logging.INFO)
+            if self.user_budget is None:
+                self.set_user_budget(self.get_user_budget())
             self.run()
 
 if __name__ == "__main__":
-        expense_tracker = ExpenseTracker(SHEET)
+        import argparse
+
+        parser = argparse.ArgumentParser(description="Track expenses in a Google Sheet.")
+        parser.add_argument("--compact", action="store_true",
+                            help="rewrite the expenses worksheet from the ledger and exit")
+        args = parser.parse_args()
+        expense_tracker = ExpenseTracker(get_spreadsheet, LocalStore())
+        if args.compact:
+            sys.exit(0 if expense_tracker.compact_expenses() else 1)
         expense_tracker.main()
@@ -0,0 +1,202 @@
+import json
+import random
+import threading
+import time
+
+import requests
+from google.auth.transport.requests import AuthorizedSession
+from gspread import Client
+from gspread.exceptions import APIError
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# Google Sheets API default quota: 60 read and 60 write requests per minute per user
+READS_PER_MINUTE = 60
+WRITES_PER_MINUTE = 60
+BURST = 10  # Requests allowed back to back before the bucket rate applies
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # Seconds before the first retry, doubled on every attempt
+BACKOFF_CAP = 32.0
+COALESCE_WINDOW = 1.0  # Seconds an identical read reuses the previous response
+POOL_SIZE = 10  # Connections kept open to the Google APIs
+# Writes that leave the sheet the same however often they are applied: value
+# updates and clears of fixed ranges. Appends and spreadsheet batchUpdates
+# (row deletions, new worksheets) are not, and a retry after a lost response
+# would apply them twice.
+IDEMPOTENT_WRITES = ("values:batchUpdate", "values:batchClear", ":clear")
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled at rate tokens per second."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, sleeping until one is available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_idempotent(method, endpoint):
+    """Return True for reads and for writes that can safely be sent twice."""
+    return method in ("get", "put") or endpoint.endswith(IDEMPOTENT_WRITES)
+
+
+def is_retryable(error, idempotent=True):
+    """Return True for errors worth retrying.
+
+    Quota errors (429) and connection timeouts happen before the request is
+    applied, so they are always retried. Server (5xx) and other connection
+    errors may come after it was, so they are only retried for idempotent
+    requests.
+    """
+    if isinstance(error, APIError):
+        status = error.response.status_code
+        return status == 429 or (idempotent and status >= 500)
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    return idempotent and isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def backoff_delay(attempt, error=None):
+    """Exponential backoff with full jitter, honouring a Retry-After header."""
+    if isinstance(error, APIError):
+        retry_after = error.response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+class _PendingRead:
+    """An identical GET that other threads can wait on instead of repeating it."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.finished = None
+
+
+class RateLimitedClient(Client):
+    """gspread client that throttles, retries and coalesces its API requests.
+
+    Every request made through gspread (find, col_values, update, batch_clear,
+    values_batch_get, ...) ends up in request(), so the whole application is
+    covered without wrapping individual worksheet methods:
+
+    - reads and writes each take a token from a bucket matched to the
+      per-minute Sheets quota;
+    - 429 responses are retried with exponential backoff and jitter, then
+      raised; so are 5xx responses and connection errors, except for
+      appends and row deletions, which may already have been applied;
+    - identical GETs in flight or completed within COALESCE_WINDOW share one
+      response; any write clears the remembered responses;
+    - requests go through one AuthorizedSession with a pooled HTTP adapter;
+    - every request's latency, bytes and retries are recorded in metrics.
+    """
+    def __init__(self, auth, session=None, reads_per_minute=READS_PER_MINUTE,
+                 writes_per_minute=WRITES_PER_MINUTE, max_retries=MAX_RETRIES):
+        if session is None and auth is not None:
+            session = AuthorizedSession(auth)
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+        super().__init__(auth, session=session)
+        self.read_bucket = TokenBucket(reads_per_minute / 60, BURST)
+        self.write_bucket = TokenBucket(writes_per_minute / 60, BURST)
+        self.max_retries = max_retries
+        self.reads = {}
+        self.reads_lock = threading.Lock()
+        self.retries = 0
+
+    def request(self, method, endpoint, params=None, data=None, json=None, files=None, headers=None):
+        if method != "get":
+            with self.reads_lock:
+                self.reads.clear()
+            return self._send(self.write_bucket, method, endpoint, params, data, json, files, headers)
+
+        key = (endpoint, _freeze(params))
+        with self.reads_lock:
+            pending = self.reads.get(key)
+            now = time.monotonic()
+            if pending is not None and (pending.finished is None or now - pending.finished < COALESCE_WINDOW):
+                owner = False
+            else:
+                self._forget_expired_reads(now)
+                pending = self.reads[key] = _PendingRead()
+                owner = True
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.response
+
+        try:
+            pending.response = self._send(self.read_bucket, method, endpoint, params, data, json, files, headers)
+            return pending.response
+        except Exception as e:
+            pending.error = e
+            with self.reads_lock:
+                if self.reads.get(key) is pending:
+                    del self.reads[key]
+            raise
+        finally:
+            pending.finished = time.monotonic()
+            pending.done.set()
+
+    def _forget_expired_reads(self, now):
+        # Called with reads_lock held
+        expired = [key for key, read in self.reads.items()
+                   if read.finished is not None and now - read.finished >= COALESCE_WINDOW]
+        for key in expired:
+            del self.reads[key]
+
+    def _send(self, bucket, method, endpoint, params, data, json, files, headers):
+        attempt = 0
+        idempotent = is_idempotent(method, endpoint)
+        started = time.perf_counter()
+        while True:
+            bucket.acquire()
+            try:
+                response = super().request(method, endpoint, params=params, data=data,
+                                           json=json, files=files, headers=headers)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e, idempotent):
+                    metrics.record_request(0, 0, attempt)
+                    self._record(method, started, attempt, "error")
+                    raise
+                time.sleep(backoff_delay(attempt, e))
+                attempt += 1
+                self.retries += 1
+            else:
+                sent = len(response.request.body or b"") if response.request is not None else 0
+                metrics.record_request(sent, len(response.content), attempt)
+                self._record(method, started, attempt, "ok")
+                return response
+
+    @staticmethod
+    def _record(method, started, retries, status):
+        # Latency includes throttling and backoff, as seen by the caller
+        metrics.REGISTRY.observe("sheets_request_seconds", time.perf_counter() - started, method=method)
+        metrics.REGISTRY.increment("sheets_requests_total", method=method, status=status)
+        if retries:
+            metrics.REGISTRY.increment("sheets_request_retries_total", retries, method=method)
+
+
+def _freeze(params):
+    """Turn request params into a hashable cache key."""
+    if params is None:
+        return None
+    return json.dumps(params, sort_keys=True, default=str)
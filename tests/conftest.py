@@ -0,0 +1,11 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The tests run against the in-memory spreadsheet the benchmarks use
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, "benchmarks")]
+
+from run import setup_logging  # noqa: E402
+
+# Keep test runs out of the app's log file
+setup_logging(os.devnull)
@@ -0,0 +1,175 @@
+"""HTTP API tests against FakeSpreadsheet and an in-memory local store."""
+import asyncio
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from api import ExpenseAPI
+from fake_sheets import FakeSpreadsheet
+from local_store import LocalStore
+from run import (
+    CATEGORIES_SHEET, CATEGORY_HEADERS, DATE_FORMAT, EXPENSE_HEADERS, EXPENSES_SHEET, Expense, ExpenseTracker,
+)
+
+TODAY = date.today().strftime(DATE_FORMAT)
+
+
+@pytest.fixture
+def spreadsheet():
+    return FakeSpreadsheet({
+        EXPENSES_SHEET: [
+            EXPENSE_HEADERS,
+            ["Lunch", "12.50", "Food", TODAY],
+            ["Bus ticket", "2.80", "Transport", TODAY],
+            ["Dinner", "30.00", "Food", TODAY],
+        ],
+        CATEGORIES_SHEET: [CATEGORY_HEADERS, ["Food"], ["Transport"], ["Rent"]],
+    })
+
+
+@pytest.fixture
+def tracker(spreadsheet):
+    tracker = ExpenseTracker(spreadsheet, LocalStore(":memory:"), budget=500.0)
+    yield tracker
+    tracker.stop_background_sync()
+
+
+@pytest.fixture
+def api(tracker):
+    api = ExpenseAPI(tracker)
+    yield api
+    api.close()
+
+
+def request(api, method, target, body=None, headers=None):
+    """Answer one request without a socket; returns (status, JSON body)."""
+    raw_body = b"" if body is None else json.dumps(body).encode()
+    return asyncio.run(api.respond(method, target, headers or {}, raw_body))
+
+
+def expense_named(api, name):
+    status, body = request(api, "GET", f"/expenses?name={name}")
+    assert status == 200
+    return body["expenses"][0]
+
+
+def test_edit_with_stale_version_is_rejected(api):
+    lunch = expense_named(api, "Lunch")
+    status, edited = request(api, "PATCH", f"/expenses/{lunch['id']}", {"version": lunch["version"], "amount": 14})
+    assert status == 200
+    assert edited["version"] != lunch["version"]
+
+    status, body = request(api, "PATCH", f"/expenses/{lunch['id']}", {"version": lunch["version"], "amount": 99})
+    assert status == 409
+    assert body["expense"]["amount"] == 14
+    status, _ = request(api, "DELETE", f"/expenses/{lunch['id']}", headers={"if-match": f'"{lunch["version"]}"'})
+    assert status == 409
+
+
+def test_version_from_if_match_header(api):
+    lunch = expense_named(api, "Lunch")
+    status, _ = request(api, "DELETE", f"/expenses/{lunch['id']}", headers={"if-match": f'"{lunch["version"]}"'})
+    assert status == 204
+
+
+def test_change_without_version_is_refused(api):
+    lunch = expense_named(api, "Lunch")
+    assert request(api, "PATCH", f"/expenses/{lunch['id']}", {"amount": 1})[0] == 428
+    assert request(api, "DELETE", f"/expenses/{lunch['id']}")[0] == 428
+    assert expense_named(api, "Lunch")["amount"] == 12.5
+
+
+@pytest.mark.parametrize("method, target, body", [
+    ("GET", "/expenses/999", None),
+    ("PATCH", "/expenses/999", {"version": "0", "amount": 1}),
+    ("DELETE", "/expenses/999", {"version": "0"}),
+    ("PUT", "/categories/Pets", {"name": "Animals"}),
+    ("DELETE", "/categories/Pets", None),
+    ("GET", "/no-such-resource", None),
+])
+def test_not_found(api, method, target, body):
+    assert request(api, method, target, body)[0] == 404
+
+
+@pytest.mark.parametrize("amount", [float("nan"), float("inf"), "nan", "-inf", "1e400", -1, None, True])
+def test_invalid_amount_is_rejected(api, tracker, amount):
+    status, _ = request(api, "POST", "/expenses", {"name": "Coffee", "amount": amount, "category": "Food",
+                                                   "date": TODAY})
+    assert status == 400
+    assert len(tracker.expenses) == 3 and not tracker.unsaved_expenses
+
+
+def test_delete_category_in_use_needs_move_to(api, tracker):
+    assert request(api, "DELETE", "/categories/Food")[0] == 409
+    assert request(api, "DELETE", "/categories/Food?move_to=Food")[0] == 400
+    assert request(api, "DELETE", "/categories/Food?move_to=Pets")[0] == 400
+    assert "Food" in tracker.expense_categories
+
+    status, body = request(api, "DELETE", "/categories/Food?move_to=Transport")
+    assert status == 200
+    assert body["categories"] == ["Transport", "Rent"]
+    assert {expense.category for expense in tracker.expenses} == {"Transport"}
+
+
+def test_delete_unused_category(api):
+    status, body = request(api, "DELETE", "/categories/Rent")
+    assert status == 200
+    assert body["categories"] == ["Food", "Transport"]
+
+
+def test_sheet_matches_ledger_after_background_save(api, tracker, spreadsheet):
+    tracker.start_background_sync()
+    lunch = expense_named(api, "Lunch")
+    bus = expense_named(api, "Bus ticket")
+    assert request(api, "POST", "/expenses", {"name": "Coffee", "amount": 3.2, "category": "Food",
+                                              "date": TODAY})[0] == 201
+    assert request(api, "PATCH", f"/expenses/{lunch['id']}", {"version": lunch["version"], "name": "Brunch"})[0] == 200
+    assert request(api, "DELETE", f"/expenses/{bus['id']}", {"version": bus["version"]})[0] == 204
+    assert request(api, "DELETE", "/categories/Transport")[0] == 200
+    tracker.stop_background_sync()
+
+    sheet = [Expense.fingerprint_of(row) for row in spreadsheet.sheets[EXPENSES_SHEET].rows[1:] if any(row)]
+    assert sheet == [expense.fingerprint() for expense in tracker.expenses]
+    assert [row[0] for row in spreadsheet.sheets[EXPENSES_SHEET].rows[1:] if any(row)] == ["Brunch", "Dinner", "Coffee"]
+    categories = [row[0] for row in spreadsheet.sheets[CATEGORIES_SHEET].rows[1:] if row and row[0]]
+    assert categories == ["Food", "Rent"]
+    assert not tracker.has_pending_changes()
+
+
+def test_rename_is_refused_whole_when_archived_months_cannot_be_read(spreadsheet):
+    closed = (date.today().replace(day=1) - timedelta(days=100)).strftime(DATE_FORMAT)
+    spreadsheet.sheets[EXPENSES_SHEET].rows.append(["Groceries", "45.00", "Food", closed])
+    tracker = ExpenseTracker(spreadsheet, LocalStore(":memory:"), budget=500.0)
+    assert tracker.archive_closed_months()
+    tracker.archived_expenses.clear()
+
+    def unavailable(*args, **kwargs):
+        raise ConnectionError("Sheets unavailable")
+
+    spreadsheet.values_batch_get = unavailable
+    api = ExpenseAPI(tracker)
+    try:
+        status, _ = request(api, "PUT", "/categories/Food", {"name": "Meals"})
+    finally:
+        api.close()
+    assert status == 503
+    assert tracker.expense_categories.names() == ["Food", "Transport", "Rent"]
+    assert {expense.category for expense in tracker.expenses} == {"Food", "Transport"}
+    assert not tracker.dirty_expenses and not tracker.archive_updates
+
+
+@pytest.mark.parametrize("length", ["abc", "-5"])
+def test_invalid_content_length_is_answered(api, length):
+    async def exchange():
+        server = await asyncio.start_server(api.handle_connection, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"POST /expenses HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n\r\n".encode())
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), 5)
+            writer.close()
+            return response
+
+    assert asyncio.run(exchange()).startswith(b"HTTP/1.1 400 ")
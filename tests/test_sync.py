@@ -0,0 +1,153 @@
+"""Saving, refreshing and archiving against FakeSpreadsheet."""
+from datetime import date, timedelta
+
+import pytest
+
+from archive import shard_title
+from fake_sheets import FakeSpreadsheet
+from local_store import LocalStore
+from run import CATEGORIES_SHEET, CATEGORY_HEADERS, DATE_FORMAT, EXPENSE_HEADERS, EXPENSES_SHEET, Expense, ExpenseTracker
+
+TODAY = date.today().strftime(DATE_FORMAT)
+CLOSED_DAY = date.today().replace(day=1) - timedelta(days=100)  # In a month old enough to archive
+CLOSED = CLOSED_DAY.strftime(DATE_FORMAT)
+CLOSED_MONTH = (CLOSED_DAY.year, CLOSED_DAY.month)
+
+
+def make_spreadsheet(names, headers=EXPENSE_HEADERS, day=TODAY):
+    rows = [list(headers)] + [[name, f"{number}.00", "Food", day][:len(headers)]
+                              for number, name in enumerate(names, start=1)]
+    return FakeSpreadsheet({EXPENSES_SHEET: rows, CATEGORIES_SHEET: [CATEGORY_HEADERS, ["Food"], ["Rent"]]})
+
+
+def sheet_names(spreadsheet, title=EXPENSES_SHEET):
+    return [row[0] for row in spreadsheet.sheets[title].rows[1:] if any(row)]
+
+
+def assert_in_sync(tracker, spreadsheet):
+    rows = spreadsheet.sheets[EXPENSES_SHEET].rows
+    for expense in tracker.expenses:
+        assert Expense.fingerprint_of(rows[expense.row - 1]) == expense.fingerprint() == expense.synced
+    assert sorted(expense.row for expense in tracker.expenses) == list(range(2, len(tracker.expenses) + 2))
+    assert not tracker.has_pending_changes()
+
+
+@pytest.fixture
+def spreadsheet():
+    return make_spreadsheet(["a", "b", "c", "d", "e"])
+
+
+@pytest.fixture
+def tracker(spreadsheet):
+    return ExpenseTracker(spreadsheet, LocalStore(":memory:"), budget=500.0)
+
+
+def expense(tracker, name):
+    return next(expense for expense in tracker.expenses if expense.name == name)
+
+
+def test_delete_edit_and_append_in_one_save(tracker, spreadsheet):
+    tracker.remove_expense(tracker.expenses.index(expense(tracker, "b")))
+    tracker.update_expense(expense(tracker, "d"), name="d2", amount=40)
+    tracker.add_expense(Expense("f", 6, "Food", TODAY))
+    assert tracker.sync()
+
+    assert sheet_names(spreadsheet) == ["a", "c", "d2", "e", "f"]
+    assert float(spreadsheet.sheets[EXPENSES_SHEET].rows[3][1]) == 40
+    assert_in_sync(tracker, spreadsheet)
+    spreadsheet.reset_calls()
+    assert tracker.sync()
+    assert spreadsheet.call_count == 0
+
+
+def test_edit_of_a_row_changed_on_the_sheet_is_not_written(tracker, spreadsheet):
+    spreadsheet.sheets[EXPENSES_SHEET].rows[2][1] = "99.00"
+    tracker.update_expense(expense(tracker, "b"), amount=20)
+    tracker.update_expense(expense(tracker, "c"), amount=30)
+    assert tracker.sync()
+
+    assert [float(row[1]) for row in spreadsheet.sheets[EXPENSES_SHEET].rows[2:4]] == [99, 30]
+    assert [row for row, _ in tracker.sync_conflicts] == [3]
+
+
+def test_refresh_after_rows_inserted_and_deleted_on_the_sheet(tracker, spreadsheet):
+    rows = spreadsheet.sheets[EXPENSES_SHEET].rows
+    rows.insert(2, ["x", "7.00", "Rent", TODAY])
+    del rows[4]  # "c"
+    rows.append(["y", "8.00", "Food", TODAY])
+    result = tracker.refresh_from_sheet(force=True)
+
+    assert sorted(expense.name for expense in result.added) == ["x", "y"]
+    assert [expense.name for expense in result.removed] == ["c"]
+    assert sorted(expense.name for expense in tracker.expenses) == ["a", "b", "d", "e", "x", "y"]
+    assert_in_sync(tracker, spreadsheet)
+
+    # Later edits land on the rows the expenses moved to
+    tracker.update_expense(expense(tracker, "d"), amount=44)
+    tracker.remove_expense(tracker.expenses.index(expense(tracker, "x")))
+    assert tracker.sync()
+    assert sheet_names(spreadsheet) == ["a", "b", "d", "e", "y"]
+    assert float(spreadsheet.sheets[EXPENSES_SHEET].rows[3][1]) == 44
+    assert_in_sync(tracker, spreadsheet)
+
+
+def test_header_mismatch_leaves_the_sheet_alone():
+    spreadsheet = make_spreadsheet(["a", "b"], headers=["Expense name", "Amount", "Category", "Date"])
+    store = LocalStore(":memory:")
+    tracker = ExpenseTracker(spreadsheet, store, budget=500.0)
+    assert tracker.sheet_problem is not None
+    assert not store.has_data()
+
+    tracker.add_expense(Expense("c", 3, "Food", TODAY))
+    assert not tracker.sync()
+    assert tracker.archive_closed_months() == []
+    assert sheet_names(spreadsheet) == ["a", "b"]
+
+
+def test_sheet_without_date_column_is_rewritten():
+    spreadsheet = make_spreadsheet(["a", "b"], headers=["Expense Name", "Amount", "Category"])
+    tracker = ExpenseTracker(spreadsheet, budget=500.0)
+    assert tracker.sheet_problem is None
+    assert tracker.sync()
+
+    assert spreadsheet.sheets[EXPENSES_SHEET].rows[0] == EXPENSE_HEADERS
+    assert sheet_names(spreadsheet) == ["a", "b"]
+    assert_in_sync(tracker, spreadsheet)
+
+
+def test_archive_skips_rows_moved_on_the_sheet():
+    spreadsheet = make_spreadsheet(["old1", "old2"], day=CLOSED)
+    spreadsheet.sheets[EXPENSES_SHEET].rows.append(["new", "3.00", "Food", TODAY])
+    store = LocalStore(":memory:")
+    tracker = ExpenseTracker(spreadsheet, store, budget=500.0)
+    rows = spreadsheet.sheets[EXPENSES_SHEET].rows
+    rows[1:] = [rows[3], rows[1], rows[2]]  # Sorted on the web: "new" first
+    assert tracker.archive_closed_months() == []
+    assert sheet_names(spreadsheet) == ["new", "old1", "old2"]
+
+    tracker.refresh_from_sheet(force=True)
+    assert tracker.archive_closed_months() == [CLOSED_MONTH]
+    assert sheet_names(spreadsheet) == ["new"]
+    assert sheet_names(spreadsheet, shard_title(CLOSED_MONTH)) == ["old1", "old2"]
+    assert_in_sync(tracker, spreadsheet)
+
+
+def test_rename_after_archiving_and_a_rename_on_another_client():
+    spreadsheet = make_spreadsheet(["old"], day=CLOSED)
+    spreadsheet.sheets[EXPENSES_SHEET].rows.append(["new", "2.00", "Food", TODAY])
+    first = ExpenseTracker(spreadsheet, budget=500.0)
+    assert first.archive_closed_months() == [CLOSED_MONTH]
+    second = ExpenseTracker(spreadsheet, budget=500.0)
+    second.load_archived_months([CLOSED_MONTH])
+
+    first.rename_category(0, "Groceries")
+    assert first.sync()
+    second.refresh_from_sheet(force=True)
+    assert second.month_categories(CLOSED_MONTH) == {"Groceries": 1.0}
+
+    second.rename_category(0, "Meals")
+    assert second.sync()
+    assert spreadsheet.sheets[shard_title(CLOSED_MONTH)].rows[1][2] == "Meals"
+    assert spreadsheet.sheets[EXPENSES_SHEET].rows[1][2] == "Meals"
+    assert [row[0] for row in spreadsheet.sheets[CATEGORIES_SHEET].rows[1:] if row[0]] == ["Meals", "Rent"]
+    assert second.archive.categories_for(CLOSED_MONTH) == {"Meals": 1.0}
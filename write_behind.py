@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+
+COALESCE_DELAY = 0.5  # Seconds to wait for more mutations before writing a burst
+RETRY_INTERVAL = 30  # Seconds between retries while changes are still pending
+
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Worker thread that batches queued mutations into a single write.
+
+    Menu actions submit a short description of what they changed and return
+    immediately. The worker waits COALESCE_DELAY after the first mutation of a
+    burst so that everything submitted meanwhile is written by one call to
+    flush(mutations). Exceptions raised by flush are kept in errors for the
+    menu to report; while has_pending() says changes are still unwritten the
+    flush is retried every retry_interval seconds.
+    """
+    def __init__(self, flush, has_pending=None, delay=COALESCE_DELAY, retry_interval=RETRY_INTERVAL):
+        self.flush = flush
+        self.has_pending = has_pending or (lambda: False)
+        self.delay = delay
+        self.retry_interval = retry_interval
+        self.mutations = queue.Queue()
+        self.errors = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        """Start the worker thread."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self.thread.start()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def submit(self, mutation):
+        """Queue a mutation for the next batched write."""
+        self.mutations.put(mutation)
+
+    def close(self):
+        """Write everything still queued and stop the worker."""
+        if self.thread is None:
+            return
+        self.mutations.put(_STOP)
+        self.thread.join()
+        self.thread = None
+
+    def take_errors(self):
+        """Return and clear the errors raised by failed writes."""
+        errors = []
+        while True:
+            try:
+                errors.append(self.errors.get_nowait())
+            except queue.Empty:
+                return errors
+
+    def _collect(self, first):
+        """Gather the burst started by first; returns (mutations, stop requested)."""
+        batch = [] if first is _STOP else [first]
+        stop = first is _STOP
+        deadline = time.monotonic() + self.delay
+        while not stop:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self.mutations.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+        return batch, stop
+
+    def _write(self, batch):
+        try:
+            self.flush(batch)
+        except Exception as e:
+            self.errors.put(e)
+
+    def _run(self):
+        while True:
+            try:
+                first = self.mutations.get(timeout=self.retry_interval)
+            except queue.Empty:
+                if self.has_pending():
+                    self._write([])
+                continue
+            batch, stop = self._collect(first)
+            if batch or (stop and self.has_pending()):
+                self._write(batch)
+            if stop:
+                return